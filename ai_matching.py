@@ -1,12 +1,52 @@
-from openai import OpenAI
-import streamlit as st
 import json
+import threading
+from config import get_secrets
 
-api_key = st.secrets["open_ai"]["api_key"]
-client = OpenAI(api_key=api_key)
 model = "gpt-4o-mini"
+# HTTP接続プール（keep-aliveで接続を使い回す）
+max_connections = 10
+max_keepalive_connections = 5
+keepalive_expiry_seconds = 120.0
 
-def call_api(candidate_dict, jobs_df):
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """
+    OpenAIクライアントを初回利用時に生成し、以降は同じもの（同じ接続プール）を使い回す。
+    OpenAI SDK の import と secrets の読み込みもここまで遅らせる。
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import httpx
+                from openai import OpenAI, DefaultHttpxClient
+
+                http_client = DefaultHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=max_connections,
+                        max_keepalive_connections=max_keepalive_connections,
+                        keepalive_expiry=keepalive_expiry_seconds,
+                    ),
+                )
+                _client = OpenAI(api_key=get_secrets()["open_ai"]["api_key"], http_client=http_client)
+    return _client
+
+def prewarm():
+    """
+    バックグラウンドでクライアント生成とTLS接続の確立を済ませておく。
+    最初のAI判定が温まった接続から始まるようにするため。
+    """
+    def _warm():
+        try:
+            get_client().models.retrieve(model)
+        except Exception as e:
+            print(f"OpenAIクライアントの事前接続に失敗しました。Error:{e}")
+
+    threading.Thread(target=_warm, daemon=True).start()
+
+def _build_messages(candidate_dict, jobs_df):
 
     candidate_text = json.dumps(candidate_dict, ensure_ascii=False)
     # JSONに変換する
@@ -15,9 +55,7 @@ def call_api(candidate_dict, jobs_df):
     # 日本語そのまま保持
     jobs_text = json.dumps(json_data, ensure_ascii=False, indent=2)
 
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
+    return [
             {"role":"developer","content":f"""あなたはプロの人材エージェントです。
 
             これから、
@@ -60,7 +98,12 @@ def call_api(candidate_dict, jobs_df):
             求人の応募必須要件：
             {jobs_text}
             """},
-        ],
+        ]
+
+def call_api(candidate_dict, jobs_df):
+    response = get_client().chat.completions.create(
+        model=model,
+        messages=_build_messages(candidate_dict, jobs_df),
         store=True,
         temperature=0
     )
@@ -73,4 +116,63 @@ def call_api(candidate_dict, jobs_df):
     except json.JSONDecodeError as e:
         print(f"JSON Parse Error: {str(e)}")
         print("Invalid JSON content:", res)
-        raise
\ No newline at end of file
+        raise
+
+def call_api_stream(candidate_dict, jobs_df):
+    """
+    call_api のストリーミング版。
+    書類通過率のグループ({"rate": .., "ids": [..]})を、レスポンスの生成途中でも
+    閉じた時点で1つずつ yield する。
+    """
+    stream = get_client().chat.completions.create(
+        model=model,
+        messages=_build_messages(candidate_dict, jobs_df),
+        store=True,
+        temperature=0,
+        stream=True,
+    )
+
+    def _chunks():
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    yield from _iter_rate_groups(_chunks())
+
+def _iter_rate_groups(chunks):
+    """
+    テキスト片の列から、トップレベルの {...} が閉じるたびに json.loads して返す。
+    配列の括弧や ```json などのオブジェクト外の文字は読み飛ばす。
+    """
+    buf = []
+    depth = 0
+    in_str = False
+    escaped = False
+    for chunk in chunks:
+        for ch in chunk:
+            if depth == 0 and ch != "{":
+                continue
+            buf.append(ch)
+            if in_str:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_str = False
+                continue
+            if ch == '"':
+                in_str = True
+            elif ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth -= 1
+                if depth == 0:
+                    text = "".join(buf)
+                    buf = []
+                    try:
+                        yield json.loads(text)
+                    except json.JSONDecodeError as e:
+                        print(f"JSON Parse Error: {str(e)}")
+                        print("Invalid JSON content:", text)
+                        raise
@@ -1,7 +1,6 @@
 import streamlit as st
 import streamlit_authenticator as stauth
 import yaml
-import search
 
 # secrets.toml から取得
 config = {
@@ -23,6 +22,8 @@ if st.session_state["authentication_status"]:
         st.session_state["logged_in"] = True
         st.rerun()
     # ログイン後に別ファイルを描画
+    # search は pandas などの重いライブラリを読み込むので、ログイン画面の表示を遅らせないようここで import する
+    import search
     search.show_search_console()
 elif st.session_state["authentication_status"] is False:
     st.error("ユーザー名またはパスワードが間違っています")
@@ -0,0 +1,151 @@
+"""
+複数の求職者の検索をまとめて実行するバッチ。
+
+求職者ごとの検索条件と経験職種・年数(job_years)を CSV か JSONL で受け取り、
+1つの ApiClient（レートリミッタ）と求人詳細キャッシュを共有して検索する。
+同じ求人は何人分の検索に出てきても詳細を1回しか取得しない。
+結果は1つのスプレッドシートに求職者ごとのシートとして書き出す。
+
+    python batch.py candidates.csv
+    python batch.py candidates.jsonl --out-dir results --format parquet   # 求職者ごとにローカルファイルへ
+
+入力の列（JSONLの場合はキー）:
+    name, keyword, keyword_category, keyword_option, min_salary, max_salary,
+    desired_locations, categories, age, holidays, works, job_years
+複数値の列は JSON の配列か ";" 区切り、job_years は {"職種名": 年数} の JSON。
+"""
+import argparse
+import csv
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from logic import ApiClient, create_api_client_from_secrets, job_search
+from metrics import SearchMetrics, json_log_listener
+from pipeline import process_jobs
+from query import SearchQuery
+from result_cache import DetailCache, get_search_checkpoint
+from sinks import open_sink
+
+
+@dataclass
+class BatchCandidate:
+    name: str
+    query: SearchQuery
+    job_years: Dict[str, int] = field(default_factory=dict)
+
+
+def _parse_list(value) -> List[Any]:
+    if value is None or value == "":
+        return []
+    if isinstance(value, list):
+        items = value
+    else:
+        text = str(value).strip()
+        items = json.loads(text) if text.startswith("[") else [v.strip() for v in text.split(";") if v.strip()]
+    # "13" のような数値の文字列はコードとして int にそろえる
+    return [int(v) if isinstance(v, str) and v.isdigit() else v for v in items]
+
+
+def _parse_job_years(value) -> Dict[str, int]:
+    if not value:
+        return {}
+    if isinstance(value, str):
+        value = json.loads(value)
+    return {str(k): int(v) for k, v in value.items()}
+
+
+def _candidate_from_row(row: Dict[str, Any], index: int) -> BatchCandidate:
+    query = SearchQuery.build(
+        keyword=row.get("keyword") or "",
+        keyword_category=int(row.get("keyword_category") or 1),
+        keyword_option=row.get("keyword_option") or "or",
+        min_salary=row.get("min_salary"),
+        max_salary=row.get("max_salary"),
+        desired_locations=_parse_list(row.get("desired_locations")),
+        categories=_parse_list(row.get("categories")),
+        age=int(row["age"]) if row.get("age") not in (None, "") else None,
+        holidays=_parse_list(row.get("holidays")),
+        works=_parse_list(row.get("works")),
+    )
+    name = row.get("name") or f"candidate_{index + 1}"
+    return BatchCandidate(name=str(name), query=query, job_years=_parse_job_years(row.get("job_years")))
+
+
+def load_candidates(path: str) -> List[BatchCandidate]:
+    """CSV(.csv) か JSONL(それ以外) から求職者の一覧を読み込む。"""
+    with open(path, encoding="utf-8-sig") as f:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    return [_candidate_from_row(row, i) for i, row in enumerate(rows)]
+
+
+def run_batch(client: ApiClient, token, candidates: List[BatchCandidate], detail_cache: Optional[DetailCache] = None, metrics: Optional[SearchMetrics] = None) -> Dict[str, Any]:
+    """
+    求職者ごとに 検索 → フラット化 → ソート → 整形 を行い、{求職者名: df} を返す。
+    検索条件が同じ求職者は検索結果を共有し、求人詳細は detail_cache で全員分を共有する。
+    """
+    if detail_cache is None:
+        detail_cache = DetailCache()
+    if metrics is None:
+        metrics = SearchMetrics()
+
+    results_by_digest: Dict[str, list] = {}
+    frames: Dict[str, Any] = {}
+    for i, candidate in enumerate(candidates, 1):
+        digest = candidate.query.digest
+        if digest not in results_by_digest:
+            results_by_digest[digest] = job_search(client, token, candidate.query, metrics=metrics, detail_cache=detail_cache, checkpoint=get_search_checkpoint(digest))
+        job_data = results_by_digest[digest]
+        print(f"[{i}/{len(candidates)}] {candidate.name}: {len(job_data)}件")
+        metrics.progress(candidates_done=i, candidates_total=len(candidates))
+        if not job_data:
+            if not job_data.complete:
+                print(f"[{i}/{len(candidates)}] {candidate.name}: 求人を取得できませんでした（一覧ページ {len(job_data.failed_offsets)}件・求人詳細 {len(job_data.failed_ids)}件の取得に失敗）")
+            continue
+        # シート名が重複しないように番号を付ける
+        name = candidate.name if candidate.name not in frames else f"{candidate.name}_{i}"
+        frames[name] = process_jobs(job_data, candidate.job_years, metrics)
+    return frames
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="複数の求職者の求人検索をまとめて実行する")
+    parser.add_argument("candidates", help="求職者ごとの検索条件 (CSV または JSONL)")
+    parser.add_argument("--out-dir", default=None, help="求職者ごとのファイルを書き出すディレクトリ。省略時はスプレッドシートに出力")
+    parser.add_argument("--format", default="csv", choices=["csv", "parquet", "feather"], help="--out-dir に書き出す形式")
+    args = parser.parse_args(argv)
+
+    candidates = load_candidates(args.candidates)
+    metrics = SearchMetrics([json_log_listener()])
+    client = create_api_client_from_secrets()
+    token = client.login()
+    try:
+        frames = run_batch(client, token, candidates, metrics=metrics)
+        if not frames:
+            print("検索結果が0件でした")
+            return
+        with metrics.phase("export"):
+            if args.out_dir:
+                os.makedirs(args.out_dir, exist_ok=True)
+                for name, df in frames.items():
+                    # ファイル名に使えない文字は _ に置き換える
+                    filename = re.sub(r'[\\/:*?"<>|]', "_", name) + "." + args.format
+                    sink = open_sink(os.path.join(args.out_dir, filename))
+                    sink.write(df)
+                    print(f"出力先：{sink.close()}")
+            else:
+                from import_csv import import_frames_to_spreadsheet
+                spreadsheet_url = import_frames_to_spreadsheet(frames)
+                print(f"作成したシート：{spreadsheet_url}")
+    finally:
+        client.logout()
+        metrics.emit_summary()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""
+求人検索パイプラインのオフラインベンチマーク。
+
+本番APIの代わりにローカルのモックHTTPサーバー(MockJobApi)を立て、
+合成した求人データに対して fetch / flatten / sort / format / export の各段階の
+所要時間とピークメモリを計測する。
+--imports では python -X importtime で主要モジュールの import 時間を測り、
+IMPORT_BUDGETS の上限と、読み込んではいけない重いライブラリをチェックする。
+
+    python benchmark.py --jobs 1000 --latency-ms 80 --rate-429 0.02 --rps 4,8,16
+    python benchmark.py --imports
+"""
+import argparse
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from definitions import job_categories
+from logic import ApiClient, ApiConfig, job_search, flatten_json, format_job_df, sort_positions
+from metrics import SearchMetrics
+from query import SearchQuery
+
+
+# ---- 合成データ ----
+
+def make_job(job_id: int, rng: random.Random) -> dict:
+    """
+    求人詳細APIのレスポンスを模した求人を1件生成する。
+    """
+    salary_min = rng.randrange(300, 900, 50)
+    return {
+        "id": job_id,
+        "name": f"求人{job_id}",
+        "company": {"id": rng.randint(1, 5000), "name": f"企業{rng.randint(1, 5000)}"},
+        "occupations": {"main": rng.choice(list(job_categories.keys()))},
+        "expectedAnnualSalary": {"min": salary_min, "max": salary_min + rng.randrange(100, 600, 50)},
+        "expectedMonthlySalary": {"min": None, "max": None} if rng.random() < 0.3 else {"min": 25, "max": 50},
+        "addresses": [{"prefecture": rng.randint(1, 47)} for _ in range(rng.randint(1, 3))],
+        "positions": rng.sample([1, 2, 3, 4, 5], rng.randint(1, 3)),
+        "frequencyOfBonusPayments": rng.randint(1, 5),
+        "actualBonusPaymentsLastYear": rng.randint(1, 3),
+        "incentive": rng.randint(1, 2),
+        "workStyles": rng.sample([1, 2], rng.randint(1, 2)),
+        "relocationProbability": rng.randint(1, 3),
+        "workHours": {"start": "09:00", "end": "18:00"},
+        "nightTimeShift": rng.randint(1, 2),
+        "averageOvertime": rng.randint(1, 6),
+        "commissionFee": {"id": 1, "fee": rng.randint(20, 40)} if rng.random() < 0.7 else {"id": 2, "fee": rng.randrange(500000, 3000000, 10000)},
+        "commissionEarnedAt": 1,
+        "minimumQualification": "・法人営業経験3年以上\n・普通自動車免許" * rng.randint(1, 4),
+        "jobDescriptions": "新規顧客への提案営業をお任せします。" * rng.randint(5, 30),
+        "annualSalaryExample": "年収600万円/30歳/メンバー",
+        "salaryComments": "経験・能力を考慮の上決定します。",
+        "addressDetail": "東京都千代田区丸の内1-1-1",
+        "locationComments": "フレックスタイム制あり",
+    }
+
+
+def make_jobs(n: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [make_job(100000 + i, rng) for i in range(n)]
+
+
+# ---- モックAPI ----
+
+class MockJobApi:
+    """
+    求人検索APIのローカル代替サーバー。
+    total(件数)・jobs(ページ)・id指定の詳細 をそれぞれ返す。
+
+    latency_ms / jitter_ms: 1リクエストあたりの応答遅延
+    rate_429: 429 を返す確率
+    tail_rate / tail_ms: この確率で応答を tail_ms 遅らせる（まれに極端に遅い応答）
+    max_page_size: 1ページで返す最大件数（limit がこれより大きくても切り詰める）。config() はこの件数をクライアントの page_size にする
+    詳細には ETag を付け、If-None-Match が一致すれば 304 を返す。Accept-Encoding に gzip があれば圧縮して返す。
+    bytes_sent に送った本文のバイト数（圧縮後）を数える。
+    """
+    def __init__(self, jobs: list, latency_ms: float = 0.0, jitter_ms: float = 0.0, rate_429: float = 0.0, max_page_size: int = 25, seed: int = 0, tail_rate: float = 0.0, tail_ms: float = 0.0):
+        self.jobs = jobs
+        self.by_id = {job["id"]: job for job in jobs}
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.max_page_size = max_page_size
+        self.tail_rate = tail_rate
+        self.tail_ms = tail_ms
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.request_count = 0
+        self.bytes_sent = 0
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def config(self, rps: int = 4, burst: int | None = None) -> ApiConfig:
+        return ApiConfig(
+            session_url=f"{self.base_url}/session",
+            job_search_url=f"{self.base_url}/jobs",
+            logout_url=f"{self.base_url}/logout",
+            login_email="bench@example.com",
+            login_password="bench",
+            rps=rps,
+            burst=burst if burst is not None else rps,
+            page_size=self.max_page_size,
+        )
+
+    def start(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                api._respond(self, {"token": "bench-token"})
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/logout":
+                    api._respond(self, {})
+                    return
+                query = parse_qs(url.query)
+                api._respond(self, api._search(query), etag="id" in query)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _search(self, query: dict):
+        if "id" in query:
+            return self.by_id.get(int(query["id"][0]))
+        if "offset" in query:
+            offset = int(query["offset"][0])
+            limit = min(int(query.get("limit", ["25"])[0]), self.max_page_size)
+            return {"jobs": [{"id": job["id"], "name": job["name"]} for job in self.jobs[offset:offset + limit]], "total": len(self.jobs)}
+        return {"total": len(self.jobs)}
+
+    def _respond(self, handler, body, etag: bool = False):
+        with self._rng_lock:
+            self.request_count += 1
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            throttled = self._rng.random() < self.rate_429
+            if self._rng.random() < self.tail_rate:
+                delay += self.tail_ms / 1000
+        if delay:
+            time.sleep(delay)
+        if throttled:
+            status, body = 429, {"message": "Too Many Requests"}
+        elif body is None:
+            status, body = 404, {"message": "Not Found"}
+        else:
+            status = 200
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if etag and status == 200:
+            headers["ETag"] = '"%s"' % hashlib.sha1(data).hexdigest()
+            if handler.headers.get("If-None-Match") == headers["ETag"]:
+                status, data = 304, b""
+        if data and "gzip" in (handler.headers.get("Accept-Encoding") or ""):
+            data = gzip.compress(data)
+            headers["Content-Encoding"] = "gzip"
+        headers["Content-Length"] = str(len(data))
+        with self._rng_lock:
+            self.bytes_sent += len(data)
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+
+# ---- 計測 ----
+
+# import にかかる時間の上限(ms)と、その import で読み込まれてはいけない重いライブラリ
+# （ログイン画面は app.py だけで描画し、search 以下はログイン後に読み込む）
+IMPORT_BUDGETS = {
+    "logic": (1000, ("streamlit", "openai", "gspread", "googleapiclient")),
+    "cli": (1000, ("streamlit", "openai", "gspread", "googleapiclient")),
+    "search": (2000, ("openai", "gspread", "googleapiclient")),
+}
+
+
+def measure_import(module: str, repeat: int = 3) -> dict:
+    """
+    新しいプロセスで python -X importtime -c "import <module>" を repeat 回実行し、最速の回の結果を返す。
+    ms: module の累計 import 時間 / loaded: 読み込まれた全モジュール / top: 時間のかかった直下の import
+    """
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"import {module} に失敗しました。{proc.stderr.strip().splitlines()[-1]}")
+        entries = []
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            entries.append((name.strip(), int(cumulative), depth))
+        total_us = next(us for name, us, depth in reversed(entries) if name == module and depth == 0)
+        if best is None or total_us < best["us"]:
+            best = {"us": total_us, "entries": entries}
+
+    children = sorted((e for e in best["entries"] if e[2] == 1), key=lambda e: e[1], reverse=True)
+    return {
+        "module": module,
+        "ms": round(best["us"] / 1000, 1),
+        "loaded": sorted({name for name, _, _ in best["entries"]}),
+        "top": [(name, round(us / 1000, 1)) for name, us, _ in children[:5]],
+    }
+
+
+def check_imports(budgets=None) -> list:
+    """
+    IMPORT_BUDGETS の各モジュールの import 時間を測り、上限超過と禁止ライブラリの読み込みを調べる。
+    """
+    reports = []
+    for module, (budget_ms, forbidden) in (budgets or IMPORT_BUDGETS).items():
+        report = measure_import(module)
+        loaded_roots = {name.split(".")[0] for name in report.pop("loaded")}
+        report["budget_ms"] = budget_ms
+        report["forbidden_loaded"] = [name for name in forbidden if name in loaded_roots]
+        report["ok"] = report["ms"] <= budget_ms and not report["forbidden_loaded"]
+        reports.append(report)
+    return reports
+
+
+def _print_import_report(reports: list):
+    for report in reports:
+        status = "OK  " if report["ok"] else "NG  "
+        print(f"{status}{report['module']:<8} {report['ms']:>8.1f}ms (上限 {report['budget_ms']}ms)")
+        if report["forbidden_loaded"]:
+            print(f"      読み込まれてはいけないライブラリ: {', '.join(report['forbidden_loaded'])}")
+        for name, ms in report["top"]:
+            print(f"      {name:<28} {ms:>8.1f}ms")
+
+
+def _measure(fn, *args, **kwargs):
+    """
+    fn を実行し (戻り値, 秒数, ピークメモリ[MB]) を返す。
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, peak / (1024 * 1024)
+
+
+def _export_csv(df) -> int:
+    # スプレッドシート出力の代わりにメモリ上のCSVへ書き出す
+    buf = io.StringIO()
+    df.to_csv(buf, index=False)
+    return len(buf.getvalue())
+
+
+def run_once(api: MockJobApi, rps: int, burst: int | None = None) -> dict:
+    """
+    モックAPIに対してパイプラインを1回実行し、段階ごとの秒数とピークメモリを返す。
+    """
+    client = ApiClient(api.config(rps, burst))
+    metrics = SearchMetrics()
+    stages = {}
+
+    # job_search の進捗printはレポートの邪魔になるので捨てる
+    with contextlib.redirect_stdout(io.StringIO()):
+        token = client.login()
+        job_data, sec, mem = _measure(job_search, client, token, SearchQuery(), metrics=metrics)
+    stages["fetch"] = {"seconds": sec, "peak_mb": mem}
+    df, sec, mem = _measure(lambda: pd.DataFrame([flatten_json(d) for d in job_data]))
+    stages["flatten"] = {"seconds": sec, "peak_mb": mem}
+    order, sec, mem = _measure(sort_positions, {}, df)
+    stages["sort"] = {"seconds": sec, "peak_mb": mem}
+    df_formatted, sec, mem = _measure(format_job_df, df, order)
+    stages["format"] = {"seconds": sec, "peak_mb": mem}
+    _, sec, mem = _measure(_export_csv, df_formatted)
+    stages["export"] = {"seconds": sec, "peak_mb": mem}
+
+    summary = metrics.summary()
+    return {"rows": len(df_formatted), "requests": summary["requests"], "retries": sum(e["retries"] for e in summary["endpoints"].values()), "stages": stages}
+
+
+def run_benchmark(jobs: int = 500, latency_ms: float = 0.0, jitter_ms: float = 0.0, rate_429: float = 0.0, max_page_size: int = 25, rps_values=(4,), burst: int | None = None, repeat: int = 3, seed: int = 0) -> list:
+    """
+    rps ごとに repeat 回実行し、段階ごとの中央値をまとめたレポートを返す。
+    """
+    reports = []
+    for rps in rps_values:
+        runs = []
+        for i in range(repeat):
+            # 実行ごとに同じ乱数列を使い、結果を再現できるようにする
+            with MockJobApi(make_jobs(jobs, seed), latency_ms, jitter_ms, rate_429, max_page_size, seed + i) as api:
+                runs.append(run_once(api, rps, burst))
+        stage_names = runs[0]["stages"].keys()
+        reports.append({
+            "jobs": jobs,
+            "rps": rps,
+            "burst": burst if burst is not None else rps,
+            "latency_ms": latency_ms,
+            "rate_429": rate_429,
+            "rows": runs[0]["rows"],
+            "requests": statistics.median(r["requests"] for r in runs),
+            "retries": statistics.median(r["retries"] for r in runs),
+            "stages": {
+                name: {
+                    "seconds": round(statistics.median(r["stages"][name]["seconds"] for r in runs), 4),
+                    "peak_mb": round(statistics.median(r["stages"][name]["peak_mb"] for r in runs), 2),
+                }
+                for name in stage_names
+            },
+        })
+    return reports
+
+
+def _print_report(reports: list):
+    for report in reports:
+        print(f"jobs={report['jobs']} rps={report['rps']} burst={report['burst']} latency={report['latency_ms']}ms 429={report['rate_429']:.0%} rows={report['rows']} requests={report['requests']} retries={report['retries']}")
+        for name, stage in report["stages"].items():
+            print(f"  {name:<8} {stage['seconds']:>9.4f}s {stage['peak_mb']:>9.2f}MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="求人検索パイプラインのオフラインベンチマーク")
+    parser.add_argument("--jobs", type=int, default=500, help="合成する求人数")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="モックAPIの応答遅延(ms)")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="応答遅延のゆらぎ(ms)")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="429を返す確率(0〜1)")
+    parser.add_argument("--max-page-size", type=int, default=25, help="1ページの件数（モックAPIの上限とクライアントの page_size）")
+    parser.add_argument("--rps", default="4", help="カンマ区切りのrps (例: 4,8,16)")
+    parser.add_argument("--burst", type=int, default=None, help="バースト数（省略時はrpsと同じ）")
+    parser.add_argument("--repeat", type=int, default=3, help="各設定の実行回数（中央値を採用）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="レポートをJSONで出力する")
+    parser.add_argument("--imports", action="store_true", help="import 時間の上限チェックだけを行う（超過時は終了コード1）")
+    args = parser.parse_args(argv)
+
+    if args.imports:
+        import_reports = check_imports()
+        if args.json:
+            print(json.dumps(import_reports, ensure_ascii=False, indent=2))
+        else:
+            _print_import_report(import_reports)
+        sys.exit(0 if all(r["ok"] for r in import_reports) else 1)
+
+    reports = run_benchmark(
+        jobs=args.jobs,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        rate_429=args.rate_429,
+        max_page_size=args.max_page_size,
+        rps_values=[int(v) for v in args.rps.split(",")],
+        burst=args.burst,
+        repeat=args.repeat,
+        seed=args.seed,
+    )
+    if args.json:
+        print(json.dumps(reports, ensure_ascii=False, indent=2))
+    else:
+        _print_report(reports)
+
+
+if __name__ == "__main__":
+    main()
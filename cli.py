@@ -0,0 +1,114 @@
+"""
+Streamlit を使わずに 検索 → フラット化 → ソート → 整形 → 出力 を実行するコマンド。
+secrets は config.get_secrets()（TOML・環境変数）から読む。
+
+    python -m cli --keyword 営業 --categories 25,26 --min-salary 500 --out result.csv
+    python -m cli --categories 経営 --job-years '{"法人営業": 3}' --out result.parquet
+    python -m cli --keyword 営業 --out result.feather
+    python -m cli --keyword 営業                # --out なしはスプレッドシートに出力
+    python -m cli --keyword 営業 --out result.parquet --chunk-size 500   # 件数が多い場合（メモリ使用量を一定に抑える）
+    python -m cli --keyword 営業 --out top.csv --max-results 100 --order-by fee   # 成果報酬の高い上位100件だけ
+    python -m cli --keyword 営業 --out result.parquet --workers 8   # フラット化・整形を8プロセスで並列に行う
+
+複数の求職者をまとめて検索する場合は batch.py を使う。
+"""
+import argparse
+import json
+
+from definitions import keyword_category_map, keyword_option_map
+from logic import ORDER_BY_FEE, create_api_client_from_secrets, job_search
+from metrics import SearchMetrics, json_log_listener
+from pipeline import process_jobs, run_chunked_pipeline
+from process_pool import TRANSPORTS, PostProcessPool
+from query import SearchQuery
+from result_cache import get_search_checkpoint
+from sinks import open_sink
+
+
+def _code_list(value: str):
+    # "25,26" → [25, 26]。親の職種名("経営")のような数値でない値はそのまま残す
+    return [int(v) if v.strip().isdigit() else v.strip() for v in value.split(",") if v.strip()]
+
+
+def _choice(value: str, mapping: dict):
+    # 表示名(例: 'のいずれかを含む(OR)')でもコード(例: 'or')でも受け付ける
+    if value in mapping:
+        return mapping[value]
+    return int(value) if value.isdigit() else value
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m cli", description="求人検索パイプラインをStreamlitなしで実行する")
+    parser.add_argument("--keyword", default="")
+    parser.add_argument("--keyword-category", default="1", help="検索種別（表示名かコード）")
+    parser.add_argument("--keyword-option", default="or", help="検索条件（表示名か or/and/excludeAnd/excludeOr）")
+    parser.add_argument("--min-salary", default=None, help="希望年収の下限(万円)")
+    parser.add_argument("--max-salary", default=None, help="希望年収の上限(万円)")
+    parser.add_argument("--locations", type=_code_list, default=[], help="都道府県コード（カンマ区切り）")
+    parser.add_argument("--categories", type=_code_list, default=[], help="希望職種のコードまたは親の職種名（カンマ区切り）")
+    parser.add_argument("--age", type=int, default=None)
+    parser.add_argument("--holidays", type=_code_list, default=[], help="休日コード（カンマ区切り）")
+    parser.add_argument("--works", type=_code_list, default=[], help="労働環境コード（カンマ区切り）")
+    parser.add_argument("--job-years", type=json.loads, default={}, help='経験職種と年数の JSON (例: {"法人営業": 3})')
+    parser.add_argument("--out", default=None, help="出力先ファイル (.csv / .parquet / .feather)。省略時はスプレッドシートに出力")
+    parser.add_argument("--max-results", type=int, default=None, help="上位この件数の求人だけ詳細を取得して出力する")
+    parser.add_argument("--order-by", choices=["api", ORDER_BY_FEE], default="api", help="--max-results で上位を選ぶ並び順（api: APIの並び順, fee: 成果報酬の高い順）")
+    parser.add_argument("--chunk-size", type=int, default=None, help="指定すると、この件数ずつ処理・出力する（件数が多い検索向け。AI判定もチャンクごと）")
+    parser.add_argument("--workers", type=int, default=None, help="フラット化・整形を行うプロセス数（0 でCPUコア数。省略時はこのプロセスで行う）")
+    parser.add_argument("--transport", choices=TRANSPORTS, default="pickle", help="--workers の結果の受け渡し方法（arrow は pyarrow が必要）")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    query = SearchQuery.build(
+        keyword=args.keyword,
+        keyword_category=_choice(args.keyword_category, keyword_category_map),
+        keyword_option=_choice(args.keyword_option, keyword_option_map),
+        min_salary=args.min_salary,
+        max_salary=args.max_salary,
+        desired_locations=args.locations,
+        categories=args.categories,
+        age=args.age,
+        holidays=args.holidays,
+        works=args.works,
+    )
+
+    metrics = SearchMetrics([json_log_listener()])
+    client = create_api_client_from_secrets()
+    token = client.login()
+    checkpoint = get_search_checkpoint(query.digest)
+    pool = PostProcessPool(args.workers, transport=args.transport) if args.workers is not None else None
+    if args.chunk_size:
+        try:
+            location = run_chunked_pipeline(client, token, query, args.job_years, metrics, checkpoint=checkpoint, sink=open_sink(args.out), chunk_size=args.chunk_size, pool=pool)
+            print(f"出力先：{location}" if location else "検索結果が0件でした")
+        finally:
+            client.logout()
+            if pool is not None:
+                pool.close()
+        return
+
+    try:
+        order_by = None if args.order_by == "api" else args.order_by
+        job_data = job_search(client, token, query, metrics=metrics, checkpoint=checkpoint, max_results=args.max_results, order_by=order_by)
+        job_data.raise_if_nothing_fetched()
+        if not job_data:
+            print("検索結果が0件でした")
+            return
+        df_formatted = process_jobs(job_data, args.job_years, metrics, pool=pool)
+        with metrics.phase("export"):
+            sink = open_sink(args.out)
+            sink.write(df_formatted)
+            location = sink.close()
+        metrics.progress(rows_written=len(df_formatted))
+        print(f"出力先：{location}")
+    finally:
+        client.logout()
+        if pool is not None:
+            pool.close()
+        metrics.emit_summary()
+
+
+if __name__ == "__main__":
+    main()
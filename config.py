@@ -0,0 +1,99 @@
+"""
+secrets の読み込み。
+
+Streamlit アプリとして動いているときは st.secrets をそのまま使う。
+それ以外(CLI・バッチ)では TOML ファイルと環境変数から同じ形の dict を組み立てる。
+
+  TOML: 環境変数 HIREQUEST_SECRETS_FILE のパス、なければ .streamlit/secrets.toml
+  環境変数: HIREQUEST__<セクション>__<キー>=値 （例: HIREQUEST__OPEN_AI__API_KEY）
+           HIREQUEST__<セクション>=<JSON> でセクションごと指定することもできる
+           （例: HIREQUEST__GCP_SERVICE_ACCOUNT='{"type": "service_account", ...}'）
+           { か [ で始まる値だけ JSON として読み、それ以外は文字列のまま（数値や真偽値は使う側で変換する）
+  .env ファイルがあれば、環境変数として先に読み込む。
+"""
+import json
+import os
+import sys
+import threading
+import tomllib
+from typing import Any, Dict
+
+ENV_PREFIX = "HIREQUEST__"
+DEFAULT_SECRETS_FILE = os.path.join(".streamlit", "secrets.toml")
+
+_secrets = None
+_lock = threading.Lock()
+
+
+def _running_in_streamlit() -> bool:
+    # streamlit を import していない(CLI)なら、ここでも import しない
+    if "streamlit" not in sys.modules:
+        return False
+    from streamlit import runtime
+    return runtime.exists()
+
+
+def _parse_env_value(value: str):
+    # パスワードやIDのような値が数値に化けないよう、JSON として読むのはオブジェクト・配列だけ
+    if not value.lstrip().startswith(("{", "[")):
+        return value
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def as_bool(value) -> bool:
+    """secrets の真偽値。環境変数から読んだ "true" / "false" のような文字列も受け付ける。"""
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+def _load_env_dotfile() -> None:
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv()
+
+
+def load_secrets(path: str | None = None, environ=None) -> Dict[str, Any]:
+    """
+    TOML ファイルと環境変数から secrets を読み込む（環境変数が優先）。
+    """
+    environ = os.environ if environ is None else environ
+    path = path or environ.get("HIREQUEST_SECRETS_FILE") or DEFAULT_SECRETS_FILE
+
+    data: Dict[str, Any] = {}
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+
+    for name, value in environ.items():
+        if not name.startswith(ENV_PREFIX):
+            continue
+        parts = [p.lower() for p in name[len(ENV_PREFIX):].split("__") if p]
+        if not parts:
+            continue
+        node = data
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = _parse_env_value(value)
+    return data
+
+
+def get_secrets():
+    """
+    secrets を返す。Streamlit 上では st.secrets、それ以外では load_secrets() の結果（初回のみ読み込み）。
+    """
+    global _secrets
+    if _running_in_streamlit():
+        import streamlit as st
+        return st.secrets
+    if _secrets is None:
+        with _lock:
+            if _secrets is None:
+                _load_env_dotfile()
+                _secrets = load_secrets()
+    return _secrets
@@ -100,6 +100,10 @@ job_categories = {
     1: "経営者・CEO・COO等", 2: "CTO・CIO", 3: "CFO", 4: "事業企画・事業統括", 5: "経営企画・経営戦略", 6: "新規事業企画・事業開発", 7: "M&A・合併・提携", 8: "その他経営関連職", 9: "経理（財務会計）", 10: "財務", 11: "管理会計", 12: "税務", 13: "IR", 14: "内部監査・内部統制", 15: "法務・コンプライアンス", 16: "知的財産・特許", 17: "総務", 18: "秘書", 19: "その他管理関連職", 20: "採用", 21: "人材開発・人材育成・研修", 22: "制度企画・組織開発", 23: "労務・給与", 24: "その他人事・労務関連職", 25: "インサイドセールス（法人向け）", 26: "フィールドセールス（法人向け）", 27: "カスタマーサクセス（法人向け）", 28: "インサイドセールス（個人向け）", 29: "フィールドセールス（個人向け）", 30: "カスタマーサクセス（個人向け）", 31: "ルートセールス・渉外・外商", 32: "代理店営業・アライアンス", 33: "カウンターセールス（内勤営業）", 34: "キャリアコンサルタント・キャリアアドバイザー", 35: "派遣コーディネーター", 36: "海外営業", 37: "その他営業関連職", 38: "カスタマーサポート・ヘルプデスク", 39: "コールセンター管理・運営（SV）", 40: "コールセンタースタッフ（インバウンド）", 41: "コールセンタースタッフ（アウトバウンド）", 42: "営業支援・プリセールス", 43: "営業マネージャー・営業管理", 44: "その他カスタマーサポート・コールセンター・営業管理関連職", 45: "一般事務", 46: "営業事務", 47: "専門事務（IT・医療・金融・不動産・貿易等）", 48: "その他事務関連職", 49: "接客・販売スタッフ", 50: "受付・コンシェルジュ", 51: "店舗・FC開発", 52: "店長・店舗管理・運営", 53: "その他接客・販売関連職", 54: "介護福祉サービス（保育・介護等）", 55: "美容サービス（美容部員・エステティシャン・美容師等）", 56: "飲食サービス（調理師・シェフ等）", 57: "アパレルサービス（アパレル販売等）", 58: "エンターテイメントサービス", 59: "旅行・宿泊サービス（客室乗務員・ホテルフロント・ツアーガイド等）", 60: "冠婚葬祭サービス（ウェディングプランナー等）", 61: "教育・学習支援サービス（講師・スクール運営等）", 62: "ドライバー（タクシー・バス・電車等）", 63: "翻訳・通訳", 64: "その他専門サービス関連職", 65: "マーケティングディレクター・CMO", 66: "Web広告運用・SEO", 67: "オフライン広告運用", 68: "広報・PR", 69: "リサーチ・データ分析", 70: "販促企画・営業企画", 71: "商品企画・商品開発", 72: "MD・VMD", 73: "仕入れ・バイヤー", 74: "その他マーケティング・企画・広報関連職", 75: "フロントエンドエンジニア", 76: "バックエンドエンジニア", 77: "インフラエンジニア（サーバー・ネットワーク）", 78: "運用・保守・監視・テクニカルサポート", 79: "スマートフォンアプリエンジニア", 80: "パッケージ開発", 81: "SE（汎用機）", 82: "SE（制御・組み込み）", 83: "AIエンジニア・データサイエンティスト", 84: "テスター・検証エンジニア", 85: "プリセールス・セールスエンジニア", 86: "情報システム・社内SE", 87: "その他ITエンジニア関連職", 88:"PdM（プロダクト責任者）", 89:"PM・PL（Web・オープン系）", 90:"PM・PL（汎用系）", 91:"PM・PL（制御・組み込み系）", 92:"EM（エンジニアマネージャー）", 93:"その他PM・PdM・EM関連職", 94:"ゲームプロデューサー・ディレクター・プランナー", 95:"ゲームプログラマー", 96:"ゲームデザイナー（グラフィック・CG）", 97:"ゲームクリエイター（サウンド・イラストレーター）", 98:"その他ゲーム関連職", 99: "UI/UXデザイナー（プロダクトデザイン）", 100: "Webデザイナー（広告・グラフィックデザイン）", 101: "Webプロデューサー・ディレクター", 102: "Webコンテンツ企画", 103: "編集・ライティング", 104: "その他Web制作・クリエイター関連職", 105: "プランナー（戦略・広告メディア）", 106: "ディレクター（クリエイティブ・制作）", 107: "編集・ライティング", 108: "その他非Web制作・クリエイター関連職", 109: "インテリアデザイナー", 110: "空間・店舗デザイナー", 111: "ファッションデザイナー", 112: "エディトリアル・DTPデザイナー", 113: "工業デザイナー", 114: "映像・CGデザイナー", 115: "その他デザイナー関連職", 116: "戦略コンサルタント", 117: "財務・会計コンサルタント", 118: "組織・人事コンサルタント", 119: "業務プロセスコンサルタント", 120: "物流コンサルタント", 121: "マーケティングコンサルタント", 122: "リサーチャー・調査員", 123: "その他ビジネスコンサルタント関連職", 124:"システムコンサルタント", 125:"パッケージ導入コンサルタント", 126:"セキュリティコンサルタント", 127:"ネットワークコンサルタント", 128:"その他ITコンサルタント関連職", 129: "公認会計士", 130: "税理士", 131: "弁護士", 132: "知財管理・司法書士・行政書士", 133: "弁理士", 134: "社会保険労務士", 135: "その他ビジネス専門職・士業関連職", 136:"ファイナンシャルプランナー", 137:"ディーラー・トレーダー", 138:"アクチュアリー・金融商品開発", 139:"ファンドマネージャー・プライベートバンカー", 140:"M&A", 141:"アナリスト・エコノミスト", 142:"財務アドバイザリー", 143:"不動産金融", 144:"金融事務（業務・管理）", 145:"コーポレート・プロジェクトファイナンス", 146:"その他金融専門職関連職", 147: "建築施工管理", 148: "内装施工管理", 149: "リフォーム施工管理", 150: "土木施工管理", 151: "プラント施工管理", 152: "電気設備施工管理", 153: "空調設備施工管理", 154: "その他施工管理関連職", 155: "不動産企画・不動産開発", 156: "用地仕入", 157: "不動産鑑定・デューデリジェンス", 158: "アセットマネジメント", 159: "プロパティマネジメント", 160: "リーシング", 161: "不動産・マンション・ビル管理", 162: "その他不動産専門職関連職", 163: "建設コンサルタント", 164: "測量", 165: "建築設計", 166: "土木設計", 167: "プラント設計", 168: "電気設備設計", 169: "空調設備設計", 170: "製図・CADオペレーター", 171: "積算", 172: "その他建築・土木関連職", 173: "研究開発・実験", 174: "機械・機構設計", 175: "筐体設計", 176: "金型設計", 177: "生産技術・生産管理", 178: "品質管理・品質保証", 179: "工場担当・工場長", 180: "セールス・サービスエンジニア", 181: "その他機械関連職", 182: "研究・開発", 183: "回路（アナログ・デジタル）", 184: "アーキテクチャ", 185: "光学設計", 186: "生産技術・生産管理", 187: "LSI設計", 188: "品質管理・品質保証", 189: "工場担当・工場長", 190: "セールス・サービスエンジニア", 191: "その他電気・電子・半導体関連職", 192: "研究開発・実験", 193: "生産技術・生産管理", 194: "品質管理・品質保証", 195: "工場担当・工場長", 196: "その他食品関連職", 197: "研究開発・実験", 198: "生産技術・生産管理", 199: "品質管理・品質保証", 200: "工場担当・工場長", 201: "その他化粧品関連職", 202: "研究開発・実験", 203: "生産技術・生産管理", 204: "品質管理・品質保証", 205: "工場担当・工場長", 206: "その他日用品関連職", 207: "研究開発・実験", 208: "生産技術・生産管理", 209: "品質管理・品質保証", 210: "工場担当・工場長", 211: "セールス・サービスエンジニア", 212: "その他化学関連職", 213: "研究開発・実験", 214: "生産技術・生産管理", 215: "品質管理・品質保証", 216: "工場担当・工場長", 217: "セールス・サービスエンジニア", 218: "その他素材関連職", 219: "医師", 220: "看護師", 221: "薬剤師・管理薬剤師", 222: "士業（歯科衛生士・栄養士等）", 223: "臨床検査技師", 224: "その他医師・看護・薬剤関連職", 225: "MR", 226: "医療機器営業（サービスエンジニア）", 227: "研究・臨床開発", 228: "品質管理・安全管理", 229: "薬事・知的財産", 230: "その他医療営業・研究開発関連職", 231: "公安系（警察官・消防官等）", 232: "専門職系（外務省、財務省、国税庁等）", 233: "福祉・心理系（社会福祉士、児童相談員等）", 234: "行政・公共施設系（市役所・県庁・図書館等）", 235: "学校法人職員", 236: "団体職員", 237: "農業、林業、水産業、畜産業", 238: "その他公務員・公共職員・農林水産関連職", 239: "工場作業", 240: "倉庫作業", 241: "配送・物流ドライバー", 242: "その他軽作業・運送関連職", 243: "技能工（整備・メカニック）", 244: "設備管理・保守点検", 245: "警備・清掃", 246: "その他技能工・警備・清掃関連職",
 }
 
+# 上位職種（job_categories_tree の親）を occupations にまとめて指定できる場合の 親の value → APIのコード。
+# API側で受け付けることが確認できた親だけを登録する（未登録の親は配下の職種コードに展開して送る）。
+parent_occupation_codes = {}
+
 job_categories_tree = [
     {
         "value": "経営",
@@ -1,9 +1,9 @@
 import datetime
-import streamlit as st
 import gspread
 from gspread_dataframe import set_with_dataframe
 from googleapiclient.discovery import build
 from google.oauth2.service_account import Credentials
+from config import get_secrets
 
 
 SCOPES = [
@@ -11,11 +11,13 @@ SCOPES = [
   "https://www.googleapis.com/auth/spreadsheets"
 ]
 
-FOLDER_ID = st.secrets["google"]["folder_id"]
-
-def import_to_spreadsheet(df):
+def create_spreadsheet():
+    """
+    共有ドライブのフォルダ内に新しいスプレッドシートを作成し、(gspreadのSpreadsheet, URL) を返す。
+    """
     # サービスアカウント認証
-    creds = Credentials.from_service_account_info(st.secrets["gcp_service_account"], scopes=SCOPES)
+    secrets = get_secrets()
+    creds = Credentials.from_service_account_info(secrets["gcp_service_account"], scopes=SCOPES)
 
     # Drive API クライアント作成
     drive_service = build("drive", "v3", credentials=creds)
@@ -29,7 +31,7 @@ def import_to_spreadsheet(df):
     file_metadata = {
         "name": title,
         "mimeType": "application/vnd.google-apps.spreadsheet",
-        "parents": [FOLDER_ID]
+        "parents": [secrets["google"]["folder_id"]]
     }
 
     spreadsheet = drive_service.files().create(
@@ -41,14 +43,27 @@ def import_to_spreadsheet(df):
     spreadsheet_id = spreadsheet.get("id")
     print(f"✅ 新規スプレッドシート作成: {spreadsheet_id}")
 
+    # URLを組み立てる
+    spreadsheet_url = f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit"
+
     # 2. gspreadでシートを開く
-    sheet = gspread_client.open_by_key(spreadsheet_id).sheet1
+    return gspread_client.open_by_key(spreadsheet_id), spreadsheet_url
 
-    # 3. dfをシートに書き込み
-    set_with_dataframe(sheet, df)
+def import_frames_to_spreadsheet(frames):
+    """
+    {シート名: df} を1つのスプレッドシートに、1シートずつ書き込む。
+    """
+    spreadsheet, spreadsheet_url = create_spreadsheet()
 
-    # URLを組み立てる
-    spreadsheet_url = f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit"
+    for i, (title, df) in enumerate(frames.items()):
+        # シート名は100文字まで
+        title = str(title)[:100]
+        if i == 0:
+            sheet = spreadsheet.sheet1
+            sheet.update_title(title)
+        else:
+            sheet = spreadsheet.add_worksheet(title=title, rows=len(df) + 1, cols=max(len(df.columns), 1))
+        set_with_dataframe(sheet, df, resize=True)
 
-    print("✅ CSVをスプレッドシートにインポートしました！")
+    print(f"✅ {len(frames)}シートをスプレッドシートにインポートしました！")
     return spreadsheet_url
@@ -0,0 +1,97 @@
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+import streamlit as st
+
+
+@dataclass
+class Job:
+    id: str
+    key: Optional[str] = None
+    status: str = "running"  # running / done / failed
+    progress: Dict[str, Any] = field(default_factory=dict)
+    result: Any = None
+    error: Optional[str] = None
+    preview: Any = None
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def update(self, **counts):
+        """進捗の件数を更新する（ワーカースレッドから呼ばれる）。"""
+        with self._lock:
+            self.progress.update(counts)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.progress)
+
+    def set_preview(self, df):
+        self.preview = df
+
+
+class JobRunner:
+    """
+    検索処理をStreamlitのスクリプトスレッドの外で実行するためのジョブ実行器。
+    ジョブはIDで登録しておき、再実行(rerun)後もIDから進捗と結果を参照できる。
+    """
+    def __init__(self, max_workers: int = 4, keep_seconds: float = 3600.0):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self.keep_seconds = keep_seconds
+
+    def submit(self, fn: Callable, *args, dedupe_key: Optional[str] = None, **kwargs) -> str:
+        """
+        fn(job, *args, **kwargs) をバックグラウンドで実行し、すぐにジョブIDを返す。
+        dedupe_key が同じジョブが実行中なら、新しく実行せずにそのジョブIDを返す。
+        """
+        job = Job(id=uuid.uuid4().hex, key=dedupe_key)
+        with self._lock:
+            self._purge()
+            if dedupe_key is not None:
+                for running in self._jobs.values():
+                    if running.key == dedupe_key and running.status == "running":
+                        return running.id
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job.id
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        if not job_id:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: Job, fn: Callable, args, kwargs):
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = "done"
+        except BaseException as e:
+            traceback.print_exc()
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+
+    def _purge(self):
+        # 終了してから一定時間たったジョブを捨てる
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.keep_seconds
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+@st.cache_resource
+def get_job_runner() -> JobRunner:
+    return JobRunner()
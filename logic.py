@@ -1,16 +1,20 @@
 import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 import time
 import threading
 from collections import deque
+from contextlib import contextmanager
 import random
+from itertools import islice
 import pandas as pd
 import json
-import streamlit as st
 from dataclasses import dataclass
-from typing import Optional, Tuple
+from typing import Any, Optional, Tuple
 from definitions import incentive, actual_bonus_payments, prefectures_reverse, num_of_bonuses, workstyle, relocation, positions, commission_earned_at, night_time_shift, overtime, job_categories
-from ai_matching import call_api
+from ai_matching import call_api, call_api_stream
+from metrics import SearchMetrics
+from query import SearchQuery
+from config import as_bool, get_secrets
 
 @dataclass
 class ApiConfig:
@@ -22,51 +26,235 @@ class ApiConfig:
     # rate limit
     rps: int = 4
     burst: int = 4
+    # 一覧APIの1ページあたりの取得件数
+    page_size: int = 25
     # timeouts
     default_timeout_seconds: float = 20.0
+    # 直近の応答時間から、エンドポイントごとにタイムアウトを短くする（上限は各リクエストのタイムアウト）
+    adaptive_timeouts: bool = False
+    # 上流APIの障害時: この回数続けて失敗したらリクエストを止め、この秒数ごとに1本だけ試す
+    breaker_failures: int = 5
+    breaker_reset_seconds: float = 30.0
+    # 求人詳細の応答が直近の p95 より遅いとき、レートの枠が空いていれば同じリクエストをもう1本送り、先に返った方を使う
+    hedge_requests: bool = False
+    # 一覧APIを成果報酬の高い順に並べるためのパラメータ（APIが対応している場合のみ指定する）
+    fee_sort_params: Tuple[Tuple[str, Any], ...] = ()
+    # login_email のほかに使えるアカウント ((email, password), ...)。rps/burst はアカウントごとにかかる
+    extra_accounts: Tuple[Tuple[str, str], ...] = ()
+
+
+@dataclass
+class ApiAccount:
+    """APIにログインするアカウント。トークンとレートリミッタはアカウントごとに持つ。"""
+    email: str
+    password: str
+    limiter: "RateLimiter"
+    token: Optional[str] = None
+    in_flight: int = 0
 
 
 class ApiClient:
     def __init__(self, config: ApiConfig):
         self.config = config
         self.session = requests.Session()
-        self._token: Optional[str] = None
+        # 1つ目が login_email のアカウント。複数あれば lease() で空いているものにリクエストを振り分ける
+        self.accounts = [
+            ApiAccount(email, password, RateLimiter(config.rps, config.burst))
+            for email, password in ((config.login_email, config.login_password),) + tuple(config.extra_accounts)
+        ]
+        self._accounts_lock = threading.Lock()
+        self._login_lock = threading.Lock()
+        self._latency: Optional["LatencyTracker"] = None
+        self.breaker = CircuitBreaker(config.breaker_failures, config.breaker_reset_seconds)
+
+    @property
+    def _token(self) -> Optional[str]:
+        return self.accounts[0].token
+
+    @_token.setter
+    def _token(self, token: Optional[str]) -> None:
+        self.accounts[0].token = token
+
+    @contextmanager
+    def lease(self):
+        """
+        いちばん空いているアカウント（実行中のリクエスト、直近1秒の発行数の少ない順）を選んで返す。
+        with を抜けるまでは、そのアカウントで実行中のリクエストとして数える。
+        """
+        with self._accounts_lock:
+            account = min(self.accounts, key=lambda a: (a.in_flight, a.limiter.recent()))
+            account.in_flight += 1
+        try:
+            yield account
+        finally:
+            with self._accounts_lock:
+                account.in_flight -= 1
+
+    @property
+    def latency(self) -> "LatencyTracker":
+        """このクライアントで共有する、エンドポイントごとの直近の応答時間。"""
+        if self._latency is None:
+            self._latency = LatencyTracker()
+        return self._latency
 
     @property
     def token(self) -> Optional[str]:
         return self._token
 
-    def _request(self, method: str, url: str, *, timeout: Optional[float] = None, **kwargs):
-        t = timeout if timeout is not None else self.config.default_timeout_seconds
+    def _request(self, method: str, url: str, *, timeout: Optional[float] = None, account: Optional[ApiAccount] = None, **kwargs):
+        """
+        account のトークンを付けて送る（省略時は1つ目のアカウント）。
+        トークンの期限切れ(401/403)なら、そのアカウントでログインし直して1回だけ送り直す。
+        """
+        account = account if account is not None else self.accounts[0]
         headers = kwargs.pop("headers", {}) or {}
-        if self._token:
-            headers.setdefault("x-circus-authentication-token", self._token)
-        return self.session.request(method, url, headers=headers, timeout=t, **kwargs)
+        token = account.token
+        response = self._send(method, url, timeout, token, dict(headers), **kwargs)
+        if response.status_code in (401, 403) and token and url != self.config.session_url and self._relogin(account, token):
+            response = self._send(method, url, timeout, account.token, dict(headers), **kwargs)
+        return response
 
-    def login(self) -> str:
-        payload = {"email": self.config.login_email, "password": self.config.login_password}
-        response = self._request("POST", self.config.session_url, json=payload)
+    def _send(self, method: str, url: str, timeout: Optional[float], token: Optional[str], headers: dict, **kwargs):
+        t = timeout if timeout is not None else self.config.default_timeout_seconds
+        if token:
+            headers.setdefault("x-circus-authentication-token", token)
+        # 上流APIが止まっている間は送らずにすぐ失敗させる（一定時間ごとに1本だけ試しに通す）
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"上流APIが応答しないため、{self.breaker.retry_after():.0f}秒後まで送信を止めています")
+        try:
+            response = self.session.request(method, url, headers=headers, timeout=t, **kwargs)
+        except requests.RequestException:
+            self.breaker.record_failure()
+            raise
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _login_account(self, account: ApiAccount) -> Optional[str]:
+        payload = {"email": account.email, "password": account.password}
+        response = self._request("POST", self.config.session_url, json=payload, account=account)
         print("login Status Code:", response.status_code)
-        if response.status_code in (200, 201):
-            data = response.json()
-            self._token = data.get("token")
-            return self._token
-        raise RuntimeError(f"ログインに失敗しました。status={response.status_code}")
+        if response.status_code not in (200, 201):
+            return None
+        account.token = response.json().get("token")
+        return account.token
+
+    def _relogin(self, account: ApiAccount, stale_token: str) -> bool:
+        """
+        期限切れの stale_token を持つアカウントでログインし直す。ログインできたら True。
+        同時に複数のリクエストが 401/403 を受けても、ログインし直すのは1回だけ。
+        """
+        with self._login_lock:
+            if account.token != stale_token:
+                # 他のスレッドがすでにログインし直している
+                return bool(account.token)
+            print(f"トークンの期限が切れたため、ログインし直します。email={account.email}")
+            return self._login_account(account) not in (None, stale_token)
+
+    def login(self) -> str:
+        """
+        すべてのアカウントでログインし、1つ目のアカウントのトークンを返す。
+        2つ目以降のアカウントでログインできなかった場合は、そのアカウントを使わずに続ける。
+        """
+        primary, *extras = self.accounts
+        if not self._login_account(primary):
+            raise RuntimeError("ログインに失敗しました。")
+        for account in extras:
+            if not self._login_account(account):
+                print(f"ログインに失敗したアカウントは使いません。email={account.email}")
+                with self._accounts_lock:
+                    self.accounts.remove(account)
+        return primary.token
 
     def logout(self) -> None:
-        response = self._request("GET", self.config.logout_url)
-        if response.status_code not in (200, 201):
-            print("ログアウトに失敗しました。Error:", response.text)
-        else:
-            print("ログアウトsuccess!!")
+        for account in self.accounts:
+            if not account.token:
+                continue
+            try:
+                response = self._request("GET", self.config.logout_url, account=account)
+            except CircuitOpenError as e:
+                print("ログアウトに失敗しました。Error:", e)
+                return
+            if response.status_code not in (200, 201):
+                print("ログアウトに失敗しました。Error:", response.text)
+            else:
+                print("ログアウトsuccess!!")
+
+
+class CircuitOpenError(RuntimeError):
+    """上流APIが止まっているとみなして、リクエストを送らなかったときの例外。"""
+
+
+class CircuitBreaker:
+    """
+    上流APIの連続失敗(接続エラー・タイムアウト・5xx)を数え、failure_threshold 回続いたら開く(open)。
+    開いている間はリクエストを送らずにすぐ失敗させ、reset_seconds 経つと1本だけ試しに通す(half-open)。
+    試しのリクエストが成功したら閉じ(closed)、失敗したらまた reset_seconds 開く。マルチスレッド対応。
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> float:
+        """次に試しのリクエストを通せるまでの秒数（閉じていれば 0）。"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_seconds - time.monotonic())
+
+    def rejecting(self) -> bool:
+        """いま送っても allow() で断られるか（試しのリクエスト枠は使わない）。"""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self._opened_at < self.reset_seconds
+            return self.state == self.HALF_OPEN
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                # 試しのリクエストを1本だけ通す。結果が出るまで他は断る
+                self.state = self.HALF_OPEN
+                print("上流APIの復旧を確認します(half-open)")
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                print("上流APIが復旧しました。送信を再開します")
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self._failures >= self.failure_threshold):
+                if self.state == self.CLOSED:
+                    print(f"上流APIが{self._failures}回続けて失敗したため、{self.reset_seconds:.0f}秒間送信を止めます")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
 
 
 def create_api_client_from_secrets() -> ApiClient:
-    api_urls = st.secrets["api_url"]
-    login_user = st.secrets["login_user"]
-    rate_cfg = st.secrets.get("rate_limit", {}) if hasattr(st, "secrets") else {}
+    secrets = get_secrets()
+    api_urls = secrets["api_url"]
+    login_user = secrets["login_user"]
+    rate_cfg = secrets.get("rate_limit", {})
     rps = int(rate_cfg.get("rps", 4))
     burst = int(rate_cfg.get("burst", rps))
+    search_cfg = secrets.get("search", {})
     cfg = ApiConfig(
         session_url=api_urls["session"],
         job_search_url=api_urls["job_search"],
@@ -75,9 +263,27 @@ def create_api_client_from_secrets() -> ApiClient:
         login_password=login_user["password"],
         rps=rps,
         burst=burst,
+        page_size=int(search_cfg.get("page_size", 25)),
+        adaptive_timeouts=as_bool(search_cfg.get("adaptive_timeouts", False)),
+        hedge_requests=as_bool(search_cfg.get("hedge_requests", False)),
+        fee_sort_params=tuple(search_cfg.get("fee_sort_params", {}).items()),
+        extra_accounts=tuple((user["email"], user["password"]) for user in secrets.get("extra_login_users", [])),
     )
     return ApiClient(cfg)
 
+def conditional_headers(entry: Optional[dict]) -> dict:
+    """
+    キャッシュに保存した ETag / Last-Modified から、条件付きリクエストのヘッダを作る。
+    変わっていなければサーバーは本文なしの 304 を返すので、キャッシュの内容を使う。
+    """
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
 def login_to_api(client: ApiClient) -> str:
     """
     ApiClient を用いてログインし、トークンを返す。
@@ -95,7 +301,17 @@ class RateLimiter:
         self.timestamps = deque()
         self._lock = threading.Lock()
 
-    def acquire(self):
+    def recent(self) -> int:
+        """直近1秒に発行した数。"""
+        now = time.monotonic()
+        with self._lock:
+            return sum(1 for t in self.timestamps if now - t <= 1.0)
+
+    def acquire(self) -> float:
+        """
+        発行できるまで待機する。待機した秒数を返す。
+        """
+        start = time.monotonic()
         while True:
             now = time.monotonic()
             with self._lock:
@@ -104,13 +320,112 @@ class RateLimiter:
                     self.timestamps.popleft()
                 if len(self.timestamps) < self.burst:
                     self.timestamps.append(now)
-                    return
+                    return now - start
                 wait = 1.0 - (now - self.timestamps[0])
             if wait > 0:
                 time.sleep(wait)
 
+    def try_acquire(self) -> bool:
+        """
+        待たずに発行できるときだけ発行する（ヘッジのように、枠が空いていなければ送らないリクエスト用）。
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self.timestamps and now - self.timestamps[0] > 1.0:
+                self.timestamps.popleft()
+            if len(self.timestamps) < self.burst:
+                self.timestamps.append(now)
+                return True
+        return False
+
+class LatencyTracker:
+    """
+    エンドポイントごとに直近 window 件の応答時間(秒)を持ち、そのパーセンタイルから
+    タイムアウトとヘッジを送るまでの待ち時間を決める。マルチスレッド対応。
+    件数が min_samples に満たないうちは判断しない（タイムアウトは既定値のまま、ヘッジもしない）。
+    """
+    def __init__(self, window: int = 500, min_samples: int = 20, timeout_factor: float = 4.0, min_timeout: float = 2.0):
+        self.window = window
+        self.min_samples = min_samples
+        self.timeout_factor = timeout_factor
+        self.min_timeout = min_timeout
+        self._samples: dict = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None:
+                samples = self._samples[endpoint] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, endpoint: str, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(endpoint, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(round(q * (len(samples) - 1))))]
+
+    def timeout(self, endpoint: str, default: float) -> float:
+        """p99 の timeout_factor 倍（min_timeout 以上、default 以下）。"""
+        p99 = self.percentile(endpoint, 0.99)
+        if p99 is None:
+            return default
+        return min(default, max(self.min_timeout, p99 * self.timeout_factor))
+
+    def hedge_delay(self, endpoint: str) -> Optional[float]:
+        """この秒数を過ぎても応答がなければヘッジを送る（p95）。"""
+        return self.percentile(endpoint, 0.95)
+
+class JobFetchError(RuntimeError):
+    """求人一覧ページの取得に(リトライしても)失敗したときの例外。"""
+    def __init__(self, offset: int, message: str):
+        super().__init__(f"offset={offset}: {message}")
+        self.offset = offset
+
+
+class JobSearchResult(list):
+    """
+    job_search の結果（求人詳細のリスト）。
+    取得できなかったページ(failed_offsets)と求人ID(failed_ids)も持ち、一部欠けていても取得できた分は返す。
+    """
+    def __init__(self, details=(), failed_offsets=(), failed_ids=()):
+        super().__init__(details)
+        self.failed_offsets = list(failed_offsets)
+        self.failed_ids = list(failed_ids)
+
+    @property
+    def complete(self) -> bool:
+        return not self.failed_offsets and not self.failed_ids
+
+    def raise_if_nothing_fetched(self) -> None:
+        """
+        1件も取得できず、取得に失敗したページ・求人IDがある場合は SearchFailedError を送出する。
+        （上流APIの障害を「検索結果0件」と取り違えないため）
+        """
+        if not self and not self.complete:
+            raise SearchFailedError(
+                f"求人を取得できませんでした（一覧ページ {len(self.failed_offsets)}件・求人詳細 {len(self.failed_ids)}件の取得に失敗）"
+            )
+
+
+class SearchFailedError(RuntimeError):
+    """検索結果が0件なのではなく、求人を取得できなかったときの例外。"""
+
+
+# ページ・詳細1件あたりの最大試行回数（初回+リトライ3回）
+MAX_ATTEMPTS = 4
+# 取得に失敗したページ・詳細を最後にまとめて取り直すまでの待ち時間
+SWEEP_DELAY_SECONDS = 2.0
+# iter_job_details で詳細を先読みする件数（取得済みで読まれるのを待っている詳細もこの件数まで）
+DETAIL_WINDOW = 64
+# job_search(order_by=...) で指定できる並び順。None はAPIの並び順
+ORDER_BY_FEE = "fee"  # 成果報酬(commissionFee.fee)の高い順
+
 def _get_rate_config(client: ApiClient) -> Tuple[int, int]:
-    return client.config.rps, client.config.burst
+    # レート制限はアカウントごとなので、全体ではアカウント数倍まで出せる
+    n = len(client.accounts)
+    return client.config.rps * n, client.config.burst * n
 
 
 def _build_query_json(keyword, keyword_category, keyword_option):
@@ -124,55 +439,163 @@ def _append_multi(params, key, values):
         params.append((key, v))
 
 
-def _build_search_params(qjson, min_salary, max_salary, desired_locations, categories, age, holidays, works, commission_fee_percentage: int):
+def _build_search_params(query: SearchQuery, commission_fee_percentage: int):
+    qjson = _build_query_json(query.keyword, query.keyword_category, query.keyword_option)
     params = [
         ("qJson", json.dumps(qjson, ensure_ascii=False)),
         ("selectionDaysIncludingDuringMeasurement", "true"),
-        ("annualSalary.max", max_salary),
-        ("annualSalary.min", min_salary),
+        ("annualSalary.max", query.max_salary),
+        ("annualSalary.min", query.min_salary),
         ("commissionFeePercentage", commission_fee_percentage),
-        ("age", age)
+        ("age", query.age)
     ]
-    _append_multi(params, "prefectures", desired_locations)
-    _append_multi(params, "holidays", holidays)
-    _append_multi(params, "workEnvironments", works)
-    _append_multi(params, "occupations", categories)
+    _append_multi(params, "prefectures", query.desired_locations)
+    _append_multi(params, "holidays", query.holidays)
+    _append_multi(params, "workEnvironments", query.works)
+    # 希望職種は SearchQuery.build で正規形(重複・包含を除いたもの)になっている
+    _append_multi(params, "occupations", query.categories)
     return params
 
 
-def _count_jobs(client: ApiClient, params) -> int:
+def _count_jobs(client: ApiClient, params, metrics: Optional[SearchMetrics] = None) -> int:
+    start = time.monotonic()
     res = client._request("GET", client.config.job_search_url, params=params)
+    if metrics:
+        metrics.request("count", res.status_code, time.monotonic() - start, len(res.content))
     print("job_count Status Code:", res.status_code)
     if res.status_code not in (200, 201):
         raise RuntimeError(f"求人件数取得に失敗しました。status={res.status_code}")
     return res.json()["total"]
 
-def job_search(client: ApiClient, token, keyword, keyword_category, keyword_option, min_salary, max_salary, desired_locations, categories, age, holidays, works):
+def job_search(client: ApiClient, token, query: SearchQuery, metrics: Optional[SearchMetrics] = None, detail_cache=None, checkpoint=None, max_results: Optional[int] = None, order_by: Optional[str] = None, required_fields=None):
     """
     Searches for jobs using the API and returns all job data across all pages.
+    一部のページ・詳細の取得に失敗しても、最後に一度まとめて取り直したうえで、
+    取得できた分を JobSearchResult として返す（失敗した offset・求人IDは結果に記録する）。
+    求人詳細は一覧ページの順（APIの並び順）に並ぶ。
+
+    metrics: リクエストごとの計測値・フェーズ時間・進捗件数
+             (pages_total, pages_fetched, pages_resumed, details_total, details_cached, details_from_list, details_fetched) の通知先
+    detail_cache: 求人詳細のキャッシュ(result_cache.DetailCache)。
+                  キャッシュにある求人は詳細を取り直さず、新しく取得した詳細は保存する。
+    checkpoint: 検索の途中経過(result_cache.SearchCheckpoint)。
+                前回途中で止まっていれば、取得済みのページ・詳細は取り直さずに続きから再開する。
+                最後まで取得できたら途中経過は消す。
+    max_results: 指定すると、order_by の並びで上位 max_results 件の詳細だけを取得する。
+                 上位が決まった時点で一覧ページの取得もやめる（APIの並び順か、APIが成果報酬順に並べられる場合）。
+    order_by: 上位を選ぶ並び順。None はAPIの並び順、ORDER_BY_FEE は成果報酬の高い順。
+    required_fields: 出力に必要な項目（省略時は REQUIRED_DETAIL_FIELDS）。
+                     一覧ページの求人がこの項目をすべて持っていれば、詳細は取得せずに一覧の内容を使う。
+                     空にすると常に詳細を取得する。
+    """
+    result = JobSearchResult()
+    # 先読みの上限なしで順番どおりに受け取る（すべての詳細を一度に並列取得するので、速さは順不同の場合と変わらない）
+    result.extend(iter_job_details(client, token, query, metrics, detail_cache, checkpoint, ordered=True, window=None, result=result, max_results=max_results, order_by=order_by, required_fields=required_fields))
+    if max_results is not None and len(result) > max_results:
+        # 一覧だけでは上位を決められなかった場合は、詳細の成果報酬で選び直す
+        if order_by == ORDER_BY_FEE:
+            result.sort(key=lambda d: _fee_sort_key(flatten_json(d).get("commissionFee.fee")))
+        del result[max_results:]
+    return result
+
+
+def iter_job_details(client: ApiClient, token, query: SearchQuery, metrics: Optional[SearchMetrics] = None, detail_cache=None, checkpoint=None, ordered: bool = False, window: Optional[int] = DETAIL_WINDOW, result: Optional[JobSearchResult] = None, max_results: Optional[int] = None, order_by: Optional[str] = None, required_fields=None):
     """
+    job_search と同じ検索を行い、求人詳細を取得できたものから1件ずつ返すジェネレータ。
+    一覧ページをすべて取得したあとは、詳細を待たずに下流(フラット化・整形・出力)へ流せる。
+
+    ordered: True なら一覧ページの順（APIの並び順）で返す。最後の取り直しで取得できた詳細だけは末尾に返す。
+    window: 詳細を先読みする件数（None なら上限なし）。読む側が遅くても、溜めておく詳細は高々この件数になる。
+    result: 取得できなかったページ・求人IDの記録先(JobSearchResult)。
+    その他の引数は job_search と同じ。一覧ページに成果報酬がなく、APIでも並べられない場合は
+    max_results 件に絞れないので全件の詳細を返す（job_search は取得後に上位を選ぶ）。
+    """
+    if metrics is None:
+        metrics = SearchMetrics()
 
     # set token on client for subsequent requests
     if token:
         client._token = token
 
-    qjson = _build_query_json(keyword, keyword_category, keyword_option)
-    fixed_params = _build_search_params(qjson, min_salary, max_salary, desired_locations, categories, age, holidays, works, 3)
+    # APIの並び順のまま上位を取れるか（成果報酬順はAPIが並べ替えに対応している場合のみ）
+    sort_params = list(client.config.fee_sort_params) if order_by == ORDER_BY_FEE else []
+    server_ordered = order_by is None or bool(sort_params)
 
-    # 件数確認
-    cnt = _count_jobs(client, fixed_params)
+    limit = client.config.page_size  # 1ページあたりの取得件数
 
-    # 20件は担保する
-    if cnt < 20:
-        fixed_params = _build_search_params(qjson, min_salary, max_salary, desired_locations, categories, age, holidays, works, 2)
-        cnt = _count_jobs(client, fixed_params)
+    meta = checkpoint.meta() if checkpoint is not None else None
+    if meta and (meta.get("order_by") != (order_by if sort_params else None) or meta.get("page_size", 25) != limit):
+        # ページの並び・ページ割りが違う途中経過は使えない
+        checkpoint.clear()
+        meta = None
+    if meta:
+        # 途中で止まった検索の続き: 件数確認はやり直さず、前回と同じページ割りで取得する
+        cnt = meta["total"]
+        fixed_params = _build_search_params(query, meta["commission_fee_percentage"])
+    else:
+        fee_percentage = 3
+        fixed_params = _build_search_params(query, fee_percentage)
 
-    jobs = []
-    limit = 25  # 1ページあたりの取得件数
+        # 件数確認
+        with metrics.phase("count"):
+            cnt = _count_jobs(client, fixed_params, metrics)
+
+            # 20件は担保する
+            if cnt < 20:
+                fee_percentage = 2
+                fixed_params = _build_search_params(query, fee_percentage)
+                cnt = _count_jobs(client, fixed_params, metrics)
+        if checkpoint is not None:
+            checkpoint.start(cnt, fee_percentage, order_by if sort_params else None, limit)
+    fixed_params = fixed_params + sort_params
 
     # ページ単位取得の並列化
     rps, burst = _get_rate_config(client)
-    limiter = RateLimiter(rps, burst)
+    latency = client.latency
+    # 詳細の取得中だけヘッジ用のスレッドを用意する
+    hedge_pool = None
+
+    def _send(endpoint, params, timeout, attempt, headers, waited, account):
+        start = time.monotonic()
+        try:
+            response = client._request("GET", client.config.job_search_url, params=params, timeout=timeout, headers=headers, account=account)
+        except requests.Timeout:
+            # タイムアウトも応答時間として残す（残さないと上流が遅くなっても p99 が上がらず、タイムアウトが伸びない）
+            latency.observe(endpoint, timeout)
+            raise
+        seconds = time.monotonic() - start
+        latency.observe(endpoint, seconds)
+        metrics.request(endpoint, response.status_code, seconds, len(response.content), attempt, waited)
+        return response
+
+    def _get(endpoint, params, timeout, attempt, headers=None):
+        # 上流APIが止まっている間は、レートの枠も使わずにすぐ失敗させる
+        if client.breaker.rejecting():
+            raise CircuitOpenError(f"上流APIが応答しないため送信を止めています。endpoint={endpoint}")
+        # 最後の試行は短くせず、呼び出し側のタイムアウトまで待つ
+        if client.config.adaptive_timeouts and attempt < MAX_ATTEMPTS - 1:
+            timeout = latency.timeout(endpoint, timeout)
+        # いちばん空いているアカウントで送る（レート制限はアカウントごと）
+        with client.lease() as account:
+            waited = account.limiter.acquire() # レートリミッター発行
+            delay = latency.hedge_delay(endpoint) if hedge_pool is not None else None
+            if delay is None:
+                return _send(endpoint, params, timeout, attempt, headers, waited, account)
+
+            # p95 を過ぎても返ってこなければ、レートの枠が空いているときだけ同じリクエストを送り、先に成功した方を使う
+            first = hedge_pool.submit(_send, endpoint, params, timeout, attempt, dict(headers or {}), waited, account)
+            done, _ = wait([first], timeout=delay)
+            if done:
+                return first.result()
+            with client.lease() as hedge_account:
+                if not hedge_account.limiter.try_acquire():
+                    return first.result()
+                metrics.emit("hedge", endpoint=endpoint, delay=round(delay, 4))
+                second = hedge_pool.submit(_send, endpoint, params, timeout, attempt, dict(headers or {}), 0.0, hedge_account)
+                for future in as_completed([first, second]):
+                    if future.exception() is None:
+                        return future.result()
+                return first.result()
 
     def _fetch_page(off):
         params = [
@@ -182,71 +605,249 @@ def job_search(client: ApiClient, token, keyword, keyword_category, keyword_opti
         ]
         params.extend(fixed_params)
         backoff = 0.5
-        for attempt in range(4):  # 0,1,2,3 → 最大4回（初回+リトライ3回）
+        for attempt in range(MAX_ATTEMPTS):
             try:
                 print(f"page: {(off // limit) + 1}")
-                limiter.acquire() # レートリミッター発行
-                response = client._request("GET", client.config.job_search_url, params=params, timeout=20)
+                response = _get("pages", params, 20, attempt)
                 print("job_search Status Code:", response.status_code)
                 if response.status_code == 200 or response.status_code == 201:
-                    return response.json().get("jobs", [])
+                    page_jobs = response.json().get("jobs", [])
+                    if checkpoint is not None:
+                        checkpoint.put_page(off, page_jobs)
+                    return page_jobs
                 if response.status_code in (429, 500, 502, 503, 504):
                     # backoff with jitter
                     sleep_s = backoff * (2 ** attempt) + random.uniform(0, 0.2)
                     print(f"一時的エラーのためリトライします(status={response.status_code})。{sleep_s:.2f}s待機")
+                    metrics.retry("pages", sleep_s, status=response.status_code)
                     time.sleep(sleep_s)
                     continue
                 print("求人取得に失敗しました。Error:", response.text)
-                exit(1)
+                raise JobFetchError(off, f"status={response.status_code}")
+            except JobFetchError:
+                raise
+            except CircuitOpenError as e:
+                raise JobFetchError(off, str(e))
             except Exception as e:
                 sleep_s = backoff * (2 ** attempt) + random.uniform(0, 0.2)
                 print(f"求人一覧ページ取得で例外発生。offset={off}, attempt={attempt+1}。{sleep_s:.2f}s待機。Error:{e}")
+                metrics.retry("pages", sleep_s, error=str(e))
                 time.sleep(sleep_s)
                 continue
         print(f"求人一覧ページ取得のリトライ上限に到達しました。offset={off}")
-        exit(1)
+        raise JobFetchError(off, "リトライ上限に到達")
+
+    # 上位 max_results 件が入るページまでで一覧の取得をやめる
+    page_total = min(cnt, max_results) if max_results is not None and server_ordered else cnt
+    offsets = list(range(0, page_total, limit))
+    done_pages = checkpoint.pages() if meta else {}
+    pages = {off: done_pages[off] for off in offsets if off in done_pages}
+    if done_pages:
+        metrics.emit("resume", digest=checkpoint.digest, pages=len(done_pages))
+    metrics.progress(pages_total=len(offsets), pages_fetched=len(done_pages), pages_resumed=len(done_pages))
+    failed_offsets = []
+    with metrics.phase("pages"), ThreadPoolExecutor(max_workers=min(6, burst)) as executor:
+        futures = {executor.submit(_fetch_page, off): off for off in offsets if off not in done_pages}
+        for i, future in enumerate(as_completed(futures), len(done_pages) + 1):
+            try:
+                pages[futures[future]] = future.result() or []
+            except JobFetchError:
+                # 失敗したページは記録しておき、最後にまとめて取り直す
+                failed_offsets.append(futures[future])
+            metrics.progress(pages_fetched=i)
 
-    offsets = list(range(0, cnt, limit))
-    with ThreadPoolExecutor(max_workers=min(6, burst)) as executor:
-        futures = [executor.submit(_fetch_page, off) for off in offsets]
-        for future in as_completed(futures):
-            data = future.result()
-            if data:
-                jobs.extend(data)
+    if failed_offsets:
+        # 上流APIが止まっていれば、復旧を確かめられるまで待ってから取り直す
+        time.sleep(max(SWEEP_DELAY_SECONDS, client.breaker.retry_after()))
+        with metrics.phase("pages_sweep"):
+            remaining = []
+            for off in sorted(failed_offsets):
+                try:
+                    pages[off] = _fetch_page(off) or []
+                except JobFetchError:
+                    remaining.append(off)
+            failed_offsets = remaining
+
+    # 一覧ページの順に並べる（以降は求人IDだけ持っておく）
+    stubs = [job for off in sorted(pages) for job in pages[off]]
+    del pages
+    if max_results is not None and len(stubs) > max_results:
+        if server_ordered:
+            stubs = stubs[:max_results]
+        else:
+            fees = [flatten_json(job).get("commissionFee.fee") for job in stubs]
+            if any(fee is not None for fee in fees):
+                # 一覧に成果報酬があれば、詳細を取る前に上位を選べる
+                top = sorted(range(len(stubs)), key=lambda i: _fee_sort_key(fees[i]))[:max_results]
+                stubs = [stubs[i] for i in sorted(top)]
+            else:
+                print("一覧に成果報酬がないため、全件の詳細を取得してから上位を選びます")
+        metrics.emit("limit", max_results=max_results, order_by=order_by, details=len(stubs))
+    # 出力に必要な項目がそろっている求人は、一覧の内容をそのまま詳細として使う
+    if required_fields is None:
+        required_fields = REQUIRED_DETAIL_FIELDS
+    from_list = {job["id"]: job for job in stubs if required_fields and _has_fields(job, required_fields)}
+    job_ids = [job["id"] for job in stubs]
+    del stubs
+    # 途中経過にも詳細を残しておく。ディスクに保存される detail_cache があれば、そちらから再開できるので不要
+    checkpoint_details = None
+    if checkpoint is not None and getattr(detail_cache, "directory", None) is None:
+        checkpoint_details = checkpoint.details
 
-    job_details = []
     # リクエスト送信(詳細情報など) 並列化
     def _fetch_detail(job_id):
+        # 期限切れでもキャッシュに前回の詳細があれば、変わっていないかを条件付きリクエストで確かめる
+        entry = detail_cache.entry(job_id) if detail_cache is not None else None
+        headers = conditional_headers(entry)
         backoff = 0.5
-        for attempt in range(4):
+        for attempt in range(MAX_ATTEMPTS):
             try:
-                limiter.acquire()
-                response = client._request("GET", client.config.job_search_url, params=[("id", job_id)], timeout=15)
+                response = _get("details", [("id", job_id)], 15, attempt, dict(headers))
+                if response.status_code == 304 and entry is not None:
+                    # 変わっていないので、キャッシュの詳細を使う
+                    detail_cache.touch(job_id)
+                    detail = entry["body"]
+                    if checkpoint_details is not None:
+                        checkpoint_details.put(job_id, detail)
+                    return detail
                 if response.status_code == 200 or response.status_code == 201:
-                    return response.json()
+                    detail = response.json()
+                    if detail_cache is not None:
+                        detail_cache.put(job_id, detail, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+                    if checkpoint_details is not None:
+                        checkpoint_details.put(job_id, detail)
+                    return detail
                 if response.status_code in (429, 500, 502, 503, 504):
                     sleep_s = backoff * (2 ** attempt) + random.uniform(0, 0.2)
                     print(f"求人詳細(求人ID:{job_id})で一時的エラー。{sleep_s:.2f}s待機してリトライ (status={response.status_code})")
+                    metrics.retry("details", sleep_s, status=response.status_code)
                     time.sleep(sleep_s)
                     continue
                 print(f"求人取得に失敗しました。求人ID: {job_id}, Error:{response.text}")
                 return None
+            except CircuitOpenError:
+                # 上流APIが止まっている間は、期限切れでもキャッシュに詳細があればそれを使う
+                if entry is not None:
+                    return entry["body"]
+                print(f"上流APIが停止中のため、求人詳細を取得できませんでした。求人ID:{job_id}")
+                return None
             except Exception as e:
                 sleep_s = backoff * (2 ** attempt) + random.uniform(0, 0.2)
                 print(f"求人詳細取得(求人ID:{job_id})で例外。attempt={attempt+1}、{sleep_s:.2f}s待機。Error:{e}")
+                metrics.retry("details", sleep_s, error=str(e))
                 time.sleep(sleep_s)
                 continue
         print(f"求人詳細取得のリトライ上限に到達しました。求人ID:{job_id}")
         return None
 
-    with ThreadPoolExecutor(max_workers=min(8, burst)) as executor:
-        futures = [executor.submit(_fetch_detail, job["id"]) for job in jobs]
-        for future in as_completed(futures):
-            detail = future.result()
-            if detail:
-                job_details.append(detail)
+    def _cached_detail(job_id):
+        cached = detail_cache.get(job_id) if detail_cache is not None else None
+        if not cached and checkpoint_details is not None:
+            cached = checkpoint_details.get(job_id)
+        return cached
+
+    def _known_detail(job_id):
+        return from_list.get(job_id) or _cached_detail(job_id)
 
-    return job_details
+    def _has_known_detail(job_id):
+        return (
+            job_id in from_list
+            or (detail_cache is not None and detail_cache.has(job_id))
+            or (checkpoint_details is not None and checkpoint_details.has(job_id))
+        )
+
+    # 一覧の内容で足りる求人・キャッシュにある詳細は使い回し、それ以外の求人だけ取得する
+    # （キャッシュの詳細そのものは、全件をメモリに載せないよう返す直前に読む。ここではあるかどうかだけを見る）
+    is_cached = [_has_known_detail(job_id) for job_id in job_ids]
+    lookahead = len(job_ids) if window is None else max(1, window)
+
+    def _completed_details(executor):
+        # (求人ID, 詳細, 今回取得したか) を返す。取得に失敗した求人の詳細は None
+        if not ordered:
+            for job_id, cached in zip(job_ids, is_cached):
+                if cached:
+                    yield job_id, _known_detail(job_id) or _fetch_detail(job_id), False
+            to_fetch = iter([job_id for job_id, cached in zip(job_ids, is_cached) if not cached])
+            pending = {executor.submit(_fetch_detail, job_id): job_id for job_id in islice(to_fetch, lookahead)}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result(), True
+                for job_id in islice(to_fetch, len(done)):
+                    pending[executor.submit(_fetch_detail, job_id)] = job_id
+            return
+        pending = {}
+        next_submit = 0
+        for i, job_id in enumerate(job_ids):
+            # i 件目から lookahead 件先までの詳細を並列で取得しておく
+            while next_submit < len(job_ids) and next_submit < i + lookahead:
+                if not is_cached[next_submit]:
+                    pending[next_submit] = executor.submit(_fetch_detail, job_ids[next_submit])
+                next_submit += 1
+            if is_cached[i]:
+                yield job_id, _known_detail(job_id) or _fetch_detail(job_id), False
+            else:
+                yield job_id, pending.pop(i).result(), True
+
+    metrics.progress(details_total=len(job_ids), details_cached=sum(is_cached) - len(from_list), details_from_list=len(from_list), details_fetched=0)
+    failed_ids = []
+    fetched = 0
+    executor = ThreadPoolExecutor(max_workers=min(8, burst))
+    if client.config.hedge_requests:
+        hedge_pool = ThreadPoolExecutor(max_workers=2 * min(8, burst))
+    try:
+        with metrics.phase("details"):
+            for job_id, detail, was_fetched in _completed_details(executor):
+                if was_fetched:
+                    fetched += 1
+                    metrics.progress(details_fetched=fetched)
+                if detail:
+                    yield detail
+                else:
+                    failed_ids.append(job_id)
+    finally:
+        # 途中で読むのをやめられた場合は、まだ始まっていない取得を取り消す
+        executor.shutdown(wait=True, cancel_futures=True)
+        if hedge_pool is not None:
+            # 負けた方のリクエストは待たない
+            hedge_pool.shutdown(wait=False)
+            hedge_pool = None
+
+    if failed_ids:
+        time.sleep(max(SWEEP_DELAY_SECONDS, client.breaker.retry_after()))
+        with metrics.phase("details_sweep"):
+            remaining = []
+            for job_id in failed_ids:
+                detail = _fetch_detail(job_id)
+                if detail:
+                    yield detail
+                else:
+                    remaining.append(job_id)
+            failed_ids = remaining
+
+    if failed_offsets or failed_ids:
+        print(f"取得できなかった求人一覧ページ: {failed_offsets} / 求人詳細: {failed_ids}")
+        metrics.progress(failed_pages=len(failed_offsets), failed_details=len(failed_ids))
+        metrics.emit("failures", offsets=failed_offsets, ids=failed_ids)
+    if result is not None:
+        result.failed_offsets = failed_offsets
+        result.failed_ids = failed_ids
+    if checkpoint is not None and not failed_offsets and not failed_ids:
+        checkpoint.clear()
+
+def _has_fields(job: dict, fields) -> bool:
+    """job が "company.name" のような項目をすべて持っているか（値が null でも項目があればよい）。"""
+    for field in fields:
+        node = job
+        for key in field.split("."):
+            if not isinstance(node, dict) or key not in node:
+                return False
+            node = node[key]
+    return True
+
+def _fee_sort_key(fee):
+    # 成果報酬の高い順（成果報酬がない求人は最後）
+    return (1, 0) if fee is None or pd.isna(fee) else (0, -fee)
 
 # 再帰的にフラット化する関数
 def flatten_json(y, prefix=''):
@@ -261,53 +862,100 @@ def flatten_json(y, prefix=''):
         out[prefix[:-1]] = y  # 最後のドットを除去
     return out
 
-def format_job_df(df):
+# format_job_df で使う元の列（一覧で持つ値は _collect_column で addresses.0.prefecture のような列から集める）
+FORMAT_SOURCE_COLUMNS = [
+    "id", "name", "company.name", "occupations.main",
+    "expectedAnnualSalary.min", "expectedAnnualSalary.max", "expectedMonthlySalary.min", "expectedMonthlySalary.max",
+    "minimumQualification", "jobDescriptions", "frequencyOfBonusPayments", "actualBonusPaymentsLastYear", "incentive",
+    "annualSalaryExample", "salaryComments", "addressDetail", "relocationProbability", "workHours.start", "workHours.end",
+    "nightTimeShift", "averageOvertime", "locationComments", "commissionFee.fee", "commissionFee.id", "commissionEarnedAt",
+]
+
+# 出力(format_job_df)・AI判定・ソートに必要な詳細の項目（一覧で持つ項目は addresses のように親の項目名）
+REQUIRED_DETAIL_FIELDS = tuple(FORMAT_SOURCE_COLUMNS) + ("addresses", "positions", "workStyles")
+
+def _is_format_source(col: str) -> bool:
+    return (
+        col in FORMAT_SOURCE_COLUMNS
+        or col.startswith(("positions.", "workStyles."))
+        or (col.startswith("addresses.") and col.endswith(".prefecture"))
+    )
+
+def format_job_df(df, order=None):
     """
     Format a job list from the JSON data.
+    元のdfは変更せず、使う列だけを取り出して出力用の列を新しいdfに組み立てる。
+    order(行の位置の並び。sort_positions の結果)を渡すと、その順に並べて整形する。
     """
+    cols = [i for i, c in enumerate(df.columns) if _is_format_source(c)]
+    src = df.iloc[order if order is not None else slice(None), cols]
+    # チャンクごとに整形すると、全件が null の項目は列ごとないことがあるので NaN の列で補う
+    missing = [c for c in FORMAT_SOURCE_COLUMNS if c not in src.columns]
+    if missing:
+        src = src.reindex(columns=list(src.columns) + missing)
 
-    df["職種"] = df["occupations.main"].map(job_categories)
-    df["想定年収"] = df.apply(lambda row: f"{row['expectedAnnualSalary.min']}万円~{row['expectedAnnualSalary.max']}万円", axis=1)
-    df["月給"] = df.apply(
-        lambda row: "" if pd.isna(row["expectedMonthlySalary.min"]) and pd.isna(row["expectedMonthlySalary.max"]) else f"{row['expectedMonthlySalary.min']}万円~{row['expectedMonthlySalary.max']}万円",
-        axis=1,
-    )
+    def _range(min_col, max_col):
+        return src[min_col].astype(str) + "万円~" + src[max_col].astype(str) + "万円"
+
+    monthly_missing = src["expectedMonthlySalary.min"].isna() & src["expectedMonthlySalary.max"].isna()
 
-    df["勤務地"] = df.apply(lambda row: collect_values(row, "addresses", prefectures_reverse, "prefecture"), axis=1)
-    df["職位"] = df.apply(lambda row: collect_values(row, "positions", positions), axis=1)
-
-    df["賞与回数"] = df["frequencyOfBonusPayments"].map(num_of_bonuses)
-    df["昨年度賞与実績"] = df["actualBonusPaymentsLastYear"].map(actual_bonus_payments)
-    df["インセンティブ"] = df["incentive"].map(incentive)
-
-    df["勤務形態"] = df.apply(lambda row: collect_values(row, "workStyles", workstyle), axis=1)
-
-    df["転勤の可能性"] = df["relocationProbability"].map(relocation)
-    df["勤務時間"] = df.apply(lambda row: f"{row['workHours.start']}~{row['workHours.end']}", axis=1)
-    df["夜間勤務"] = df["nightTimeShift"].map(night_time_shift)
-    df["月刊平均残業時間"] = df["averageOvertime"].map(overtime)
-    df["成果報酬金額"] = df.apply(format_commission, axis=1)
-    df["成果地点"] = df["commissionEarnedAt"].map(commission_earned_at)
-
-    # 抽出項目を絞り込み
-    df = df[["id", "name", "company.name", "職種", "職位", "想定年収", "月給", "勤務地", "minimumQualification", "jobDescriptions", "賞与回数", "昨年度賞与実績", "インセンティブ", "annualSalaryExample", "salaryComments", "addressDetail", "勤務形態", "転勤の可能性", "勤務時間", "夜間勤務", "月刊平均残業時間", "locationComments", "成果報酬金額", "成果地点"]]
-
-    # 項目名を変更
-    df = df.rename(columns={
-        "id": "求人ID",
-        "name": "求人名",
-        "company.name": "募集企業名",
-        "minimumQualification": "応募必須条件",
-        "jobDescriptions": "仕事内容",
-        "annualSalaryExample": "年収例",
-        "salaryComments": "給与・年収例 補足情報",
-        "addressDetail": "勤務地詳細",
-        "locationComments": "勤務地・勤務時間 補足情報",
+    # 抽出項目を絞り込み、項目名を変更
+    out = pd.DataFrame({
+        "求人ID": src["id"],
+        "求人名": src["name"],
+        "募集企業名": src["company.name"],
+        "職種": src["occupations.main"].map(job_categories),
+        "職位": _collect_column(src, "positions", positions),
+        "想定年収": _range("expectedAnnualSalary.min", "expectedAnnualSalary.max"),
+        "月給": _range("expectedMonthlySalary.min", "expectedMonthlySalary.max").mask(monthly_missing, ""),
+        "勤務地": _collect_column(src, "addresses", prefectures_reverse, "prefecture"),
+        "応募必須条件": src["minimumQualification"],
+        "仕事内容": src["jobDescriptions"],
+        "賞与回数": src["frequencyOfBonusPayments"].map(num_of_bonuses),
+        "昨年度賞与実績": src["actualBonusPaymentsLastYear"].map(actual_bonus_payments),
+        "インセンティブ": src["incentive"].map(incentive),
+        "年収例": src["annualSalaryExample"],
+        "給与・年収例 補足情報": src["salaryComments"],
+        "勤務地詳細": src["addressDetail"],
+        "勤務形態": _collect_column(src, "workStyles", workstyle),
+        "転勤の可能性": src["relocationProbability"].map(relocation),
+        "勤務時間": src["workHours.start"].astype(str) + "~" + src["workHours.end"].astype(str),
+        "夜間勤務": src["nightTimeShift"].map(night_time_shift),
+        "月刊平均残業時間": src["averageOvertime"].map(overtime),
+        "勤務地・勤務時間 補足情報": src["locationComments"],
+        "成果報酬金額": _commission_column(src),
+        "成果地点": src["commissionEarnedAt"].map(commission_earned_at),
     })
+    out.index = pd.RangeIndex(len(out))
+    return out
 
-    return df
+def _collect_column(src, prefix: str, mapping: dict, suffix: str = "", sep: str = "、"):
+    """
+    collect_values の列版。prefix.0(.suffix), prefix.1(.suffix), ... の列の値を mapping で変換して、行ごとに sep でつなげる。
+    """
+    values = []
+    i = 0
+    while True:
+        col = ".".join([prefix, str(i)] + ([suffix] if suffix else []))
+        if col not in src:
+            break
+        values.append([mapping.get(v, "不明") if pd.notna(v) else None for v in src[col].tolist()])
+        i += 1
+    if not values:
+        return pd.Series("", index=src.index)
+    return pd.Series([sep.join(v for v in row if v is not None) for row in zip(*values)], index=src.index)
+
+def _commission_column(src):
+    """format_commission の列版。"""
+    if "commissionFee.fee" not in src or "commissionFee.id" not in src:
+        return pd.Series(None, index=src.index, dtype=object)
+    texts = [
+        f"理論年収×{fee}%" if cid == 1 else f"{fee:,}円"
+        for fee, cid in zip(src["commissionFee.fee"].tolist(), src["commissionFee.id"].tolist())
+    ]
+    return pd.Series(texts, index=src.index)
 
-def job_count(client: ApiClient, token, keyword, keyword_category, keyword_option, min_salary, max_salary, desired_locations, categories, age, holidays, works):
+def job_count(client: ApiClient, token, query: SearchQuery):
     """
     Searches for jobs using the API and returns the job count.
     """
@@ -315,15 +963,14 @@ def job_count(client: ApiClient, token, keyword, keyword_category, keyword_optio
     if token:
         client._token = token
 
-    qjson = _build_query_json(keyword, keyword_category, keyword_option)
-    params = _build_search_params(qjson, min_salary, max_salary, desired_locations, categories, age, holidays, works, 3)
+    params = _build_search_params(query, 3)
     cnt = _count_jobs(client, params)
 
     if cnt >= 20:
         return cnt
 
     # 20件は担保する → 手数料割合2で再計算
-    params = _build_search_params(qjson, min_salary, max_salary, desired_locations, categories, age, holidays, works, 2)
+    params = _build_search_params(query, 2)
     cnt = _count_jobs(client, params)
     return cnt
 
@@ -364,12 +1011,18 @@ def format_commission(row):
         return f"{fee:,}円"
 
 def sort(job_years, df):
+    df_sorted = df.take(sort_positions(job_years, df))
+    df_sorted.index = pd.RangeIndex(len(df_sorted))
+    return df_sorted
+
+def sort_positions(job_years, df):
+    """
+    sort の並び順を、dfの行の位置の並び(take や format_job_df の order に渡せる)で返す。
+    並べ替えたdf自体は作らないので、列の多いdfをコピーせずに済む。
+    """
     # 経験職種情報がない場合は、feeでのソートのみ
     if not job_years:
-        sorted_ids = sort_fee(df)
-
-        df_sorted = df.set_index("id").loc[sorted_ids].reset_index()
-        return df_sorted
+        return _positions(df, sort_fee(df))
 
     # aiが書類通過率を判定
     matching_json = call_api(job_years, df)
@@ -380,28 +1033,102 @@ def sort(job_years, df):
     sorted_ids = []
 
     for group in matching_json:
-        # 重複除去
-        unique_ids = [] # rateごとのID保持する
-        for _id in group["ids"]:
-            if _id not in seen:  # 初めて出てきたIDなら採用
-                seen.add(_id)
-                unique_ids.append(_id)
-            # すでに出たIDはスキップ（＝高いレートの方に残る）
-        if unique_ids:
-            # ソート（commissionFeeの降順）
-            sub_ids = sort_fee(df, unique_ids)
-            sorted_ids.extend(sub_ids)
+        _extend_group_ids(df, group, seen, sorted_ids)
 
     # --- AIに出てこなかった残りのIDを最後に追加 ---
+    _extend_remaining_ids(df, sorted_ids)
+
+    return _positions(df, sorted_ids)
+
+def sort_stream(job_years, df):
+    """
+    sort のストリーミング版。
+    AIの判定結果をrateグループ単位で受け取るたびに、その時点までの並び順のdfを yield する。
+    最後に yield するdfは sort の結果と同じ（AIに出てこなかった残りのIDも含む）。
+    """
+    for order in sort_positions_stream(job_years, df):
+        df_sorted = df.take(order)
+        df_sorted.index = pd.RangeIndex(len(df_sorted))
+        yield df_sorted
+
+def sort_positions_stream(job_years, df):
+    """
+    sort_stream の並び順だけを、dfの行の位置の並びで yield する。
+    """
+    if not job_years:
+        yield sort_positions(job_years, df)
+        return
+
+    seen = set()
+    sorted_ids = []
+    for group in call_api_stream(job_years, df):
+        if _extend_group_ids(df, group, seen, sorted_ids):
+            yield _positions(df, sorted_ids)
+
+    _extend_remaining_ids(df, sorted_ids)
+    yield _positions(df, sorted_ids)
+
+def _positions(df, ids):
+    """求人IDの並びを、dfの行の位置の並びにする（同じIDが複数行ある場合は最初の行）。"""
+    position = pd.Series(range(len(df)), index=df["id"].to_numpy())
+    position = position[~position.index.duplicated()]
+    return position.reindex(ids).to_numpy()
+
+def _extend_group_ids(df, group, seen, sorted_ids):
+    """
+    rateグループ1つ分のIDを重複除去・fee順ソートして sorted_ids に追加する。
+    追加した件数を返す。
+    """
+    # 重複除去
+    unique_ids = [] # rateごとのID保持する
+    for _id in group["ids"]:
+        if _id not in seen:  # 初めて出てきたIDなら採用
+            seen.add(_id)
+            unique_ids.append(_id)
+        # すでに出たIDはスキップ（＝高いレートの方に残る）
+    if not unique_ids:
+        return 0
+    # ソート（commissionFeeの降順）
+    sub_ids = sort_fee(df, unique_ids)
+    sorted_ids.extend(sub_ids)
+    return len(sub_ids)
+
+def _extend_remaining_ids(df, sorted_ids):
     remaining_ids = df.loc[~df["id"].isin(sorted_ids), "id"].tolist()
     remaining_ids_sort = sort_fee(df, remaining_ids)
     sorted_ids.extend(remaining_ids_sort)
 
-    df_sorted = df.set_index("id").loc[sorted_ids].reset_index()
-    return df_sorted
+def score_jobs(job_years, df):
+    """
+    dfの求人を (求人ID, 書類通過率, 成果報酬) のタプルのリストにする。
+    全件そろわなくても、チャンクごとに判定した結果を集めて order_scored で並べれば sort と同じ並びになる。
+    経験職種情報がない場合・AIに出てこなかった求人の書類通過率は None。
+    """
+    rates = {}
+    if job_years:
+        for group in call_api(job_years, df):
+            for _id in group["ids"]:
+                # 同じIDが複数のグループにある場合は高いレートの方に残る
+                rates.setdefault(_id, group["rate"])
+    fees = df["commissionFee.fee"].tolist() if "commissionFee.fee" in df else [None] * len(df)
+    return [(_id, rates.get(_id), fee) for _id, fee in zip(df["id"].tolist(), fees)]
+
+def order_scored(scored):
+    """
+    score_jobs のタプルを並べ替えた求人IDのリストを返す。
+    書類通過率の高い順、同じ通過率の中は成果報酬の高い順で、判定のない求人は最後に成果報酬の高い順で並べる。
+    """
+    def _key(item):
+        _, rate, fee = item
+        no_fee = fee is None or pd.isna(fee)
+        return (rate is None, -(rate or 0), no_fee, 0 if no_fee else -fee)
+    return [item[0] for item in sorted(scored, key=_key)]
 
-def sort_fee(df, ids = []):
-    if ids:
-        df = df[df["id"].isin(ids)]
-    ids_sort = df.sort_values("commissionFee.fee", ascending=False)["id"].tolist()
+def sort_fee(df, ids=None):
+    # dfを絞り込む(コピーする)代わりに、求人ID → fee の列だけで並べ替える
+    # ids が None なら全件（空のリストは0件。AIが全件を判定した残りの求人など）
+    fees = pd.Series(df["commissionFee.fee"].to_numpy(), index=df["id"].to_numpy())
+    if ids is not None:
+        fees = fees[fees.index.isin(ids)]
+    ids_sort = fees.sort_values(ascending=False).index.tolist()
     return ids_sort
@@ -0,0 +1,139 @@
+import json
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+
+class SearchMetrics:
+    """
+    job_search やパイプラインの計測値を集めるイベントストリーム。
+    イベントは dict で、subscribe したリスナーに順に渡される。
+
+    event の種類:
+      request  : 1リクエストごとの endpoint / status / latency / bytes / attempt / limiter_wait
+      retry    : リトライ発生時の endpoint / status / error / sleep
+      phase_start / phase : フェーズ(count, pages, details, flatten, sort, format, export)の開始と所要秒数
+      progress : 進捗の件数 (pages_fetched, details_fetched, ai_scored, rows_written など)
+      summary  : summary() の内容
+    """
+    def __init__(self, listeners: Optional[List[Callable[[dict], None]]] = None):
+        self._listeners = list(listeners or [])
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, List[float]] = defaultdict(list)
+        self._statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self._retries: Dict[str, int] = defaultdict(int)
+        self._bytes = 0
+        self._limiter_wait = 0.0
+        self.phases: Dict[str, float] = {}
+        self.started_at = time.monotonic()
+
+    def subscribe(self, listener: Callable[[dict], None]):
+        self._listeners.append(listener)
+
+    def emit(self, event: str, **fields):
+        payload = {"event": event, "ts": round(time.time(), 3), **fields}
+        for listener in self._listeners:
+            try:
+                listener(payload)
+            except Exception as e:
+                print(f"計測イベントの通知に失敗しました。Error:{e}")
+
+    def request(self, endpoint: str, status: int, latency: float, nbytes: int, attempt: int = 0, limiter_wait: float = 0.0):
+        with self._lock:
+            self._latencies[endpoint].append(latency)
+            self._statuses[endpoint][status] += 1
+            self._bytes += nbytes
+            self._limiter_wait += limiter_wait
+        self.emit(
+            "request", endpoint=endpoint, status=status, latency=round(latency, 4),
+            bytes=nbytes, attempt=attempt, limiter_wait=round(limiter_wait, 4),
+        )
+
+    def retry(self, endpoint: str, sleep: float, status: Optional[int] = None, error: Optional[str] = None):
+        with self._lock:
+            self._retries[endpoint] += 1
+        self.emit("retry", endpoint=endpoint, status=status, error=error, sleep=round(sleep, 3))
+
+    def progress(self, **counts):
+        self.emit("progress", **counts)
+
+    @contextmanager
+    def phase(self, name: str):
+        self.emit("phase_start", name=name)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            seconds = time.monotonic() - start
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + seconds
+            self.emit("phase", name=name, seconds=round(seconds, 4))
+
+    def summary(self) -> dict:
+        with self._lock:
+            endpoints = {}
+            for endpoint, latencies in self._latencies.items():
+                ordered = sorted(latencies)
+                endpoints[endpoint] = {
+                    "requests": len(ordered),
+                    "retries": self._retries.get(endpoint, 0),
+                    "statuses": dict(self._statuses[endpoint]),
+                    "latency_p50": round(_percentile(ordered, 0.50), 4),
+                    "latency_p95": round(_percentile(ordered, 0.95), 4),
+                    "latency_max": round(ordered[-1], 4),
+                }
+            elapsed = time.monotonic() - self.started_at
+            total_requests = sum(e["requests"] for e in endpoints.values())
+            return {
+                "elapsed": round(elapsed, 3),
+                "requests": total_requests,
+                "requests_per_second": round(total_requests / elapsed, 3) if elapsed > 0 else 0.0,
+                "bytes": self._bytes,
+                "limiter_wait": round(self._limiter_wait, 3),
+                "endpoints": endpoints,
+                "phases": {k: round(v, 4) for k, v in self.phases.items()},
+            }
+
+    def emit_summary(self) -> dict:
+        summary = self.summary()
+        self.emit("summary", **summary)
+        return summary
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    idx = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def json_log_listener(stream=None, skip=("progress", "phase_start")):
+    """
+    イベントを1行1JSONで出力するリスナーを返す（デフォルトは標準出力）。
+    """
+    lock = threading.Lock()
+
+    def _listener(event: dict):
+        if event["event"] in skip:
+            return
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with lock:
+            print(line, file=stream or sys.stdout, flush=True)
+
+    return _listener
+
+
+def progress_listener(update: Callable[..., None]):
+    """
+    progress イベントの件数と、実行中のフェーズ名(phase)を update(**counts) に渡すリスナーを返す。
+    """
+    def _listener(event: dict):
+        if event["event"] == "progress":
+            update(**{k: v for k, v in event.items() if k not in ("event", "ts")})
+        elif event["event"] == "phase_start":
+            update(phase=event["name"])
+
+    return _listener
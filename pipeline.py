@@ -0,0 +1,185 @@
+import pandas as pd
+from typing import Optional, Tuple
+from logic import (
+    ApiClient,
+    JobSearchResult,
+    job_search,
+    iter_job_details,
+    format_job_df,
+    flatten_json,
+    score_jobs,
+    order_scored,
+    sort_positions_stream,
+)
+from metrics import SearchMetrics
+from process_pool import PostProcessPool
+from query import SearchQuery
+from result_cache import DetailCache, ResultSetCache, SearchCheckpoint, SearchDiff
+from sinks import Sink, SheetsSink
+from spool import RowSpool
+
+# run_chunked_pipeline で一度に処理・出力する件数
+CHUNK_SIZE = 500
+# on_preview に渡す途中経過の件数（上位のみ）
+PREVIEW_ROWS = 50
+
+
+def refresh_search(client: ApiClient, token, query: SearchQuery, detail_cache: DetailCache, result_cache: ResultSetCache, metrics: Optional[SearchMetrics] = None, checkpoint: Optional[SearchCheckpoint] = None) -> Tuple[list, SearchDiff]:
+    """
+    前回の検索結果を使い回して検索し直す。
+    一覧ページは取り直して求人IDの増減を確認するが、詳細は見たことのない求人の分だけ取得する。
+    (求人詳細, 前回との差分) を返し、スナップショットを今回の結果で更新する。
+    """
+    job_data = job_search(client, token, query, metrics=metrics, detail_cache=detail_cache, checkpoint=checkpoint)
+    ids = [d["id"] for d in job_data]
+    diff = result_cache.diff(query.digest, ids)
+    if job_data.complete:
+        result_cache.save(query.digest, ids)
+    else:
+        # 取得できなかった分を「掲載終了」と誤判定しないよう、欠けた結果ではスナップショットを更新しない
+        diff.removed = []
+    if metrics:
+        metrics.progress(new_jobs=len(diff.added), removed_jobs=len(diff.removed))
+        metrics.emit("diff", digest=query.digest, added=len(diff.added), removed=len(diff.removed), kept=len(diff.kept))
+    return job_data, diff
+
+
+def process_jobs(job_data: list, job_years, metrics: Optional[SearchMetrics] = None, on_preview=None, pool: Optional[PostProcessPool] = None):
+    """
+    求人詳細のリストを フラット化 → ソート → 整形 して、出力用のdfを返す。
+    ソートは並び順(行の位置)だけを求め、整形で使う列に絞ってから並べ替える（列の多いdfはコピーしない）。
+    pool を渡すと、フラット化と整形をワーカープロセスで並列に行い（"flatten" フェーズ）、
+    整形済みのdfを並び順どおりに並べ替える。
+    """
+    if metrics is None:
+        metrics = SearchMetrics()
+
+    formatted = None
+    with metrics.phase("flatten"):
+        if pool is not None:
+            df, formatted = pool.flatten_and_format(job_data)
+        else:
+            flat_data = [flatten_json(d) for d in job_data]
+            df = pd.DataFrame(flat_data)
+
+    order = None
+    with metrics.phase("sort"):
+        for order in sort_positions_stream(job_years, df):
+            if job_years:
+                metrics.progress(ai_scored=len(order))
+            if on_preview:
+                on_preview(df.take(order[:PREVIEW_ROWS]))
+
+    with metrics.phase("format"):
+        if formatted is not None:
+            return formatted.take(order).reset_index(drop=True)
+        return format_job_df(df, order)
+
+
+def run_search_pipeline(client: ApiClient, token, query: SearchQuery, job_years, metrics: Optional[SearchMetrics] = None, on_preview=None, detail_cache: Optional[DetailCache] = None, result_cache: Optional[ResultSetCache] = None, sink: Optional[Sink] = None, checkpoint: Optional[SearchCheckpoint] = None, max_results: Optional[int] = None, order_by: Optional[str] = None, pool: Optional[PostProcessPool] = None):
+    """
+    検索 → フラット化 → ソート → 整形 → 出力 までを一括で実行する。
+    出力先(シートのURLやファイルパス)を返す（検索結果が0件の場合は None）。
+    取得に失敗して1件も取得できなかった場合は SearchFailedError を送出する（0件とは区別する）。
+
+    metrics: 計測値・フェーズ時間・進捗件数(ai_scored, rows_written など)の通知先
+    on_preview: AI判定の途中経過(ソート済みdfの上位 PREVIEW_ROWS 件)を受け取るコールバック
+    detail_cache / result_cache: 指定した場合は refresh_search で前回の結果を使い回す
+    sink: 出力先（省略時はスプレッドシート）
+    checkpoint: 検索の途中経過。前回途中で止まった検索なら続きから再開する
+    max_results / order_by: 上位 max_results 件だけを出力する（job_search を参照）。
+                            一部だけの検索結果になるので、前回の結果との差分(refresh_search)は使わない
+    pool: 指定した場合はフラット化・整形をワーカープロセスで並列に行う
+    """
+    if metrics is None:
+        metrics = SearchMetrics()
+
+    try:
+        if max_results is not None:
+            job_data = job_search(client, token, query, metrics=metrics, detail_cache=detail_cache, checkpoint=checkpoint, max_results=max_results, order_by=order_by)
+        elif detail_cache is not None and result_cache is not None:
+            job_data, _ = refresh_search(client, token, query, detail_cache, result_cache, metrics, checkpoint)
+        else:
+            job_data = job_search(client, token, query, metrics=metrics, detail_cache=detail_cache, checkpoint=checkpoint)
+        job_data.raise_if_nothing_fetched()
+        if not job_data:
+            return None
+
+        df_formatted = process_jobs(job_data, job_years, metrics, on_preview, pool)
+
+        with metrics.phase("export"):
+            sink = sink or SheetsSink()
+            sink.write(df_formatted)
+            location = sink.close()
+        metrics.progress(rows_written=len(df_formatted))
+        return location
+    finally:
+        metrics.emit_summary()
+
+
+def _chunked(items, size: int):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _process_chunks(chunks, metrics: SearchMetrics, pool: Optional[PostProcessPool] = None):
+    """
+    チャンクごとに (フラット化したdf, 整形済みのdf) を yield する。
+    pool がなければこのプロセスでフラット化だけを行い、整形済みのdfは None（呼び出し側で整形する）。
+    """
+    if pool is not None:
+        yield from pool.imap(chunks)
+        return
+    for chunk in chunks:
+        with metrics.phase("flatten"):
+            df = pd.DataFrame([flatten_json(d) for d in chunk])
+            del chunk
+        yield df, None
+
+
+def run_chunked_pipeline(client: ApiClient, token, query: SearchQuery, job_years, metrics: Optional[SearchMetrics] = None, detail_cache: Optional[DetailCache] = None, checkpoint: Optional[SearchCheckpoint] = None, sink: Optional[Sink] = None, chunk_size: int = CHUNK_SIZE, pool: Optional[PostProcessPool] = None):
+    """
+    件数が多い検索向けの run_search_pipeline。メモリ使用量が件数によらずほぼ一定になる。
+
+    求人詳細を chunk_size 件ずつ 取得 → フラット化 → AI判定 → 整形 し、整形済みの行は一時ファイル(RowSpool)に退避する。
+    メモリに残すのは並び替えに使う (求人ID, 書類通過率, 成果報酬) だけで、
+    最後に全体の並び順どおりに chunk_size 件ずつ一時ファイルから読み出して sink へ書き込む。
+    AI判定はチャンクごとに行う。プレビューと前回結果との差分には対応しない。
+    pool を渡すと、チャンクのフラット化・整形をワーカープロセスで並列に行い、その間に取得とAI判定を進める。
+    出力先を返す（検索結果が0件の場合は None）。
+    取得に失敗して1件も取得できなかった場合は SearchFailedError を送出する。
+    """
+    if metrics is None:
+        metrics = SearchMetrics()
+
+    scored = []
+    result = JobSearchResult()
+    try:
+        with RowSpool() as spool:
+            details = iter_job_details(client, token, query, metrics, detail_cache, checkpoint, result=result)
+            for df, formatted in _process_chunks(_chunked(details, chunk_size), metrics, pool):
+                with metrics.phase("sort"):
+                    scored.extend(score_jobs(job_years, df))
+                with metrics.phase("format"):
+                    spool.append(formatted if formatted is not None else format_job_df(df))
+                metrics.progress(rows_processed=len(scored))
+            if not scored:
+                result.raise_if_nothing_fetched()
+                return None
+
+            with metrics.phase("export"):
+                order = order_scored(scored)
+                sink = sink or SheetsSink()
+                for start in range(0, len(order), chunk_size):
+                    sink.write(spool.read(order[start:start + chunk_size]))
+                location = sink.close()
+            metrics.progress(rows_written=spool.count)
+            return location
+    finally:
+        metrics.emit_summary()
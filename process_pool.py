@@ -0,0 +1,146 @@
+"""
+求人詳細の フラット化 → 整形 を別プロセスで並列に実行する。
+
+flatten_json / format_job_df は CPU を使う処理で、同じプロセスで動かすと GIL を取り合って
+Streamlit の他のセッションの描画が遅くなる。件数が多い出力では、チャンクごとにワーカープロセスへ渡して
+コア数の分だけ並列に処理する。
+
+ワーカーからは (並べ替え・AI判定・プレビューに使う列だけのdf, 整形済みのdf) を返す。
+受け渡しは pickle（既定）か Arrow IPC（transport="arrow"。pyarrow が必要）。
+"""
+import multiprocessing
+import os
+import pickle
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from typing import Iterable, Iterator, Optional, Tuple
+
+import pandas as pd
+
+from config import get_secrets
+from logic import flatten_json, format_job_df
+
+# ワーカーへ一度に渡す求人数
+POOL_CHUNK_SIZE = 500
+# フラット化したdfのうち、整形後もメインプロセスで使う列（並べ替え・AI判定・プレビュー）
+KEY_COLUMNS = ["id", "name", "company.name", "commissionFee.fee", "minimumQualification"]
+TRANSPORTS = ("pickle", "arrow")
+
+
+def _dump(df: pd.DataFrame, transport: str):
+    if transport != "arrow":
+        return df
+    import pyarrow as pa
+
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # 型の混ざった列は Arrow にできないので、そのチャンクだけ pickle で返す
+        return pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def _load(payload) -> pd.DataFrame:
+    if isinstance(payload, pd.DataFrame):
+        return payload
+    if isinstance(payload, bytes):
+        return pickle.loads(payload)
+    import pyarrow as pa
+
+    return pa.ipc.open_stream(payload).read_all().to_pandas()
+
+
+def flatten_and_format(job_data: list, transport: str = "pickle"):
+    """ワーカーで実行する処理。求人詳細のリストを (KEY_COLUMNS のdf, 整形済みのdf) にする。"""
+    df = pd.DataFrame([flatten_json(d) for d in job_data])
+    keys = df.reindex(columns=KEY_COLUMNS)
+    return _dump(keys, transport), _dump(format_job_df(df), transport)
+
+
+def _start_method() -> str:
+    # スレッドを使っているプロセス(Streamlit)から fork するとデッドロックしうるので、forkserver か spawn で起動する
+    methods = multiprocessing.get_all_start_methods()
+    return "forkserver" if "forkserver" in methods else "spawn"
+
+
+class PostProcessPool:
+    """
+    フラット化・整形を行うワーカープロセスのプール。
+    workers: プロセス数（省略時は CPU コア数）
+    chunk_size: ワーカーへ一度に渡す求人数
+    transport: 結果の受け渡し方法（"pickle" か "arrow"）
+    """
+    def __init__(self, workers: Optional[int] = None, chunk_size: int = POOL_CHUNK_SIZE, transport: str = "pickle"):
+        if transport not in TRANSPORTS:
+            raise ValueError(f"transport は {TRANSPORTS} のいずれかです: {transport}")
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.transport = transport
+        self._executor = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            context = multiprocessing.get_context(_start_method())
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=context)
+        return self._executor
+
+    def imap(self, chunks: Iterable[list]) -> Iterator[Tuple[pd.DataFrame, pd.DataFrame]]:
+        """
+        チャンクごとの (KEY_COLUMNS のdf, 整形済みのdf) を、渡した順に yield する。
+        同時にワーカーへ渡すのは workers の2倍のチャンクまで（取得が速くてもメモリに溜め込まない）。
+        """
+        pending = deque()
+        try:
+            for chunk in chunks:
+                pending.append(self.executor.submit(flatten_and_format, chunk, self.transport))
+                del chunk
+                if len(pending) >= self.workers * 2:
+                    yield self._result(pending.popleft())
+            while pending:
+                yield self._result(pending.popleft())
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def flatten_and_format(self, job_data: list) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """job_data 全体を チャンクに分けて並列に処理し、(KEY_COLUMNS のdf, 整形済みのdf) を返す。"""
+        it = iter(job_data)
+        chunks = iter(lambda: list(islice(it, self.chunk_size)), [])
+        results = list(self.imap(chunks))
+        keys = pd.concat([k for k, _ in results], ignore_index=True)
+        formatted = pd.concat([f for _, f in results], ignore_index=True)
+        return keys, formatted
+
+    @staticmethod
+    def _result(future):
+        keys, formatted = future.result()
+        return _load(keys), _load(formatted)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@lru_cache(maxsize=None)
+def get_postprocess_pool() -> Optional[PostProcessPool]:
+    """
+    プロセス内で共有するプール。secrets の [search] process_workers が 1 以上のときだけ使う（未設定なら None）。
+    """
+    search_cfg = get_secrets().get("search", {})
+    workers = int(search_cfg.get("process_workers", 0))
+    if workers <= 0:
+        return None
+    return PostProcessPool(workers, transport=search_cfg.get("process_transport", "pickle"))
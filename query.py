@@ -0,0 +1,68 @@
+import hashlib
+import json
+from dataclasses import asdict, dataclass
+from typing import Any, Iterable, Optional, Tuple
+
+from tree_index import normalize_occupations
+
+
+@dataclass(frozen=True)
+class SearchQuery:
+    """
+    求人検索の条件。
+    build() で正規化して作る（複数選択の項目はソート済みタプル、年収は int）ので、
+    同じ条件なら選択の順番や入力の書き方が違っても等しくなり、digest も一致する。
+    """
+    keyword: str = ""
+    keyword_category: int = 1
+    keyword_option: str = "or"
+    min_salary: Optional[int] = None
+    max_salary: Optional[int] = None
+    desired_locations: Tuple[int, ...] = ()
+    categories: Tuple[Any, ...] = ()
+    age: Optional[int] = None
+    holidays: Tuple[int, ...] = ()
+    works: Tuple[int, ...] = ()
+
+    @classmethod
+    def build(cls, keyword="", keyword_category=1, keyword_option="or", min_salary=None, max_salary=None, desired_locations=None, categories=None, age=None, holidays=None, works=None) -> "SearchQuery":
+        return cls(
+            keyword=(keyword or "").strip(),
+            keyword_category=keyword_category,
+            keyword_option=keyword_option,
+            min_salary=_parse_salary(min_salary),
+            max_salary=_parse_salary(max_salary),
+            desired_locations=_sorted_tuple(desired_locations),
+            categories=normalize_occupations(categories),
+            age=int(age) if age is not None else None,
+            holidays=_sorted_tuple(holidays),
+            works=_sorted_tuple(works),
+        )
+
+    @property
+    def digest(self) -> str:
+        """条件から決まる安定したハッシュ値。キャッシュのキーに使う。"""
+        payload = json.dumps(asdict(self), ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _sorted_tuple(values: Optional[Iterable[Any]]) -> Tuple[Any, ...]:
+    return tuple(sorted(set(values or ())))
+
+
+def _parse_salary(value) -> Optional[int]:
+    """
+    希望年収の入力(万円)を int にする。空なら None。
+    "500"・"500万"・"1,000" のような書き方を受け付ける。
+    """
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return value
+    text = str(value).strip().replace(",", "").replace("，", "").replace("万円", "").replace("万", "")
+    if not text:
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        raise ValueError(f"希望年収は数値(万円)で入力してください: {value}")
@@ -0,0 +1,281 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
+
+# キャッシュの保存先（環境変数 HIREQUEST_CACHE_DIR で変更可）
+CACHE_DIR = os.environ.get("HIREQUEST_CACHE_DIR", os.path.join(".cache", "hirequest"))
+# 求人詳細を再取得せずに使い回す期間
+DETAIL_MAX_AGE_SECONDS = 3 * 24 * 60 * 60
+# 期限切れの詳細も条件付きリクエスト用に残すが、これより長く取得していない詳細のファイルは消す
+DETAIL_RETENTION_SECONDS = 30 * 24 * 60 * 60
+# 途中で止まった検索を続きから再開できる期間（これより古い途中経過は捨ててやり直す）
+CHECKPOINT_MAX_AGE_SECONDS = 24 * 60 * 60
+
+
+def _write_json(path: str, data) -> None:
+    # 書き込み途中で落ちても壊れたファイルが残らないよう、一時ファイルから置き換える
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _read_json(path: str):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+class DetailCache:
+    """
+    求人ID → 求人詳細(APIのレスポンス) のキャッシュ。
+    メモリ上に持ちつつ、directory を指定した場合は1件1ファイルで保存する。
+    keep_in_memory=False にするとファイルにだけ保存する（件数が多くてもメモリを使わない）。
+    """
+    def __init__(self, directory: Optional[str] = None, max_age_seconds: Optional[float] = DETAIL_MAX_AGE_SECONDS, keep_in_memory: bool = True):
+        self.directory = directory
+        self.max_age_seconds = max_age_seconds
+        self.keep_in_memory = keep_in_memory or directory is None
+        self._entries: Dict[Any, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, job_id) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _load(self, job_id) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(job_id)
+        if entry is None and self.directory:
+            entry = _read_json(self._path(job_id))
+            if entry is not None and self.keep_in_memory:
+                with self._lock:
+                    self._entries[job_id] = entry
+        return entry
+
+    def entry(self, job_id) -> Optional[Dict[str, Any]]:
+        """
+        保存している {"fetched_at", "body", "etag", "last_modified"} を期限切れでも返す。
+        期限切れの詳細は、etag / last_modified を使った条件付きリクエストで更新の有無を確かめる。
+        """
+        return self._load(job_id)
+
+    def get(self, job_id) -> Optional[dict]:
+        entry = self._load(job_id)
+        if entry is None:
+            return None
+        if self.max_age_seconds is not None and time.time() - entry["fetched_at"] > self.max_age_seconds:
+            return None
+        return entry["body"]
+
+    def has(self, job_id) -> bool:
+        """
+        期限内の詳細を持っているか。本文は読まない（ファイルはあるかどうかと更新時刻だけを見る）。
+        """
+        with self._lock:
+            entry = self._entries.get(job_id)
+        if entry is not None:
+            fetched_at = entry["fetched_at"]
+        elif self.directory:
+            try:
+                fetched_at = os.stat(self._path(job_id)).st_mtime
+            except FileNotFoundError:
+                return False
+        else:
+            return False
+        return self.max_age_seconds is None or time.time() - fetched_at <= self.max_age_seconds
+
+    def put(self, job_id, body: dict, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        entry = {"fetched_at": time.time(), "body": body}
+        if etag:
+            entry["etag"] = etag
+        if last_modified:
+            entry["last_modified"] = last_modified
+        if self.keep_in_memory:
+            with self._lock:
+                self._entries[job_id] = entry
+        if self.directory:
+            _write_json(self._path(job_id), entry)
+
+    def touch(self, job_id) -> None:
+        """サーバーで変わっていなかった(304)詳細を、今取得したものとして扱う。"""
+        entry = self._load(job_id)
+        if entry is not None:
+            self.put(job_id, entry["body"], entry.get("etag"), entry.get("last_modified"))
+
+    def prune(self, retention_seconds: float = DETAIL_RETENTION_SECONDS) -> int:
+        """
+        retention_seconds より長く取得・更新していない詳細のファイルを消し、消した件数を返す。
+        （put / touch でファイルを書き直すので、ファイルの更新時刻で判断する）
+        """
+        if not self.directory or not os.path.isdir(self.directory):
+            return 0
+        cutoff = time.time() - retention_seconds
+        removed = 0
+        with os.scandir(self.directory) as it:
+            for f in it:
+                if not f.name.endswith(".json"):
+                    continue
+                try:
+                    if f.stat().st_mtime < cutoff:
+                        os.remove(f.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+
+@dataclass
+class SearchDiff:
+    """前回の検索結果(スナップショット)と今回の検索結果の差分。"""
+    added: List[Any] = field(default_factory=list)
+    removed: List[Any] = field(default_factory=list)
+    kept: List[Any] = field(default_factory=list)
+    previous_fetched_at: Optional[float] = None
+
+    @property
+    def is_first_run(self) -> bool:
+        return self.previous_fetched_at is None
+
+
+class ResultSetCache:
+    """
+    検索条件(SearchQuery.digest)ごとに、前回の検索で見つかった求人IDのスナップショットを保存する。
+    """
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        self._snapshots: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def load(self, digest: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            snapshot = self._snapshots.get(digest)
+        if snapshot is None and self.directory:
+            snapshot = _read_json(self._path(digest))
+        return snapshot
+
+    def save(self, digest: str, ids: Iterable[Any]) -> None:
+        snapshot = {"fetched_at": time.time(), "ids": list(ids)}
+        with self._lock:
+            self._snapshots[digest] = snapshot
+        if self.directory:
+            _write_json(self._path(digest), snapshot)
+
+    def diff(self, digest: str, ids: Iterable[Any]) -> SearchDiff:
+        """スナップショットと ids を比べた差分を返す（スナップショットは更新しない）。"""
+        ids = list(ids)
+        snapshot = self.load(digest)
+        if snapshot is None:
+            return SearchDiff(added=ids)
+        previous = set(snapshot["ids"])
+        current = set(ids)
+        return SearchDiff(
+            added=[i for i in ids if i not in previous],
+            removed=[i for i in snapshot["ids"] if i not in current],
+            kept=[i for i in ids if i in previous],
+            previous_fetched_at=snapshot["fetched_at"],
+        )
+
+
+class SearchCheckpoint:
+    """
+    1つの検索(SearchQuery.digest)の途中経過。
+    件数確認の結果・取得済みの一覧ページ・取得済みの求人詳細を保存しておき、
+    同じ検索をやり直したときに取得済みの分は取り直さずに続きから再開する。
+    検索が最後まで終わったら clear() で消す。
+    """
+    def __init__(self, digest: str, directory: Optional[str] = None, max_age_seconds: Optional[float] = CHECKPOINT_MAX_AGE_SECONDS):
+        self.digest = digest
+        self.directory = os.path.join(directory, digest) if directory else None
+        self.max_age_seconds = max_age_seconds
+        self.details = DetailCache(os.path.join(self.directory, "details") if self.directory else None, max_age_seconds=None, keep_in_memory=False)
+        self._meta: Optional[Dict[str, Any]] = None
+        self._pages: Dict[int, list] = {}
+        self._lock = threading.Lock()
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    def _pages_dir(self) -> str:
+        return os.path.join(self.directory, "pages")
+
+    def meta(self) -> Optional[Dict[str, Any]]:
+        """start() で保存した件数確認の結果。途中経過がない・古すぎる場合は None。"""
+        meta = self._meta
+        if meta is None and self.directory:
+            meta = _read_json(self._meta_path())
+        if meta is not None and self.max_age_seconds is not None and time.time() - meta["started_at"] > self.max_age_seconds:
+            self.clear()
+            return None
+        self._meta = meta
+        return meta
+
+    def start(self, total: int, commission_fee_percentage: int, order_by: Optional[str] = None, page_size: int = 25) -> None:
+        self._meta = {"started_at": time.time(), "total": total, "commission_fee_percentage": commission_fee_percentage, "order_by": order_by, "page_size": page_size}
+        if self.directory:
+            _write_json(self._meta_path(), self._meta)
+
+    def pages(self) -> Dict[int, list]:
+        """取得済みの一覧ページ（offset → 求人のリスト）。"""
+        pages = {}
+        if self.directory and os.path.isdir(self._pages_dir()):
+            for name in os.listdir(self._pages_dir()):
+                if name.endswith(".json"):
+                    data = _read_json(os.path.join(self._pages_dir(), name))
+                    if data is not None:
+                        pages[int(name[:-len(".json")])] = data
+        with self._lock:
+            pages.update(self._pages)
+        return pages
+
+    def put_page(self, offset: int, jobs: list) -> None:
+        with self._lock:
+            self._pages[offset] = jobs
+        if self.directory:
+            _write_json(os.path.join(self._pages_dir(), f"{offset}.json"), jobs)
+
+    def clear(self) -> None:
+        self._meta = None
+        with self._lock:
+            self._pages.clear()
+        self.details = DetailCache(self.details.directory, max_age_seconds=None, keep_in_memory=False)
+        if self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+@lru_cache(maxsize=None)
+def get_detail_cache() -> DetailCache:
+    """
+    プロセス内で共有する求人詳細キャッシュ。作成時に長く使われていない詳細のファイルを消す。
+    全ユーザーの検索で使うので、メモリには持たずファイルだけに保存する（使うたびにファイルから読む）。
+    """
+    cache = DetailCache(os.path.join(CACHE_DIR, "details"), keep_in_memory=False)
+    cache.prune()
+    return cache
+
+
+@lru_cache(maxsize=None)
+def get_result_set_cache() -> ResultSetCache:
+    """プロセス内で共有する検索結果スナップショット。"""
+    return ResultSetCache(os.path.join(CACHE_DIR, "results"))
+
+
+def get_search_checkpoint(digest: str, job_key: Optional[str] = None) -> SearchCheckpoint:
+    """
+    検索条件ごとの途中経過（ディスクに保存するので、セッションが落ちても再開できる）。
+    job_key を渡すと、同じ検索条件でも job_key ごとに別の途中経過にする
+    （経験職種や件数の違う検索が同時に走っても、先に終わった方が他方の途中経過を消さない）。
+    """
+    name = digest if job_key is None else f"{digest}-{hashlib.sha256(job_key.encode('utf-8')).hexdigest()[:16]}"
+    return SearchCheckpoint(name, os.path.join(CACHE_DIR, "checkpoints"))
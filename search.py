@@ -1,17 +1,26 @@
+import json
 import streamlit as st
 from st_ant_tree import st_ant_tree
 from definitions import keyword_category_map, keyword_option_map, prefectures, job_categories_tree, holidays, work_environment, job_ex_categories_tree
 from logic import (
+  ORDER_BY_FEE,
   login_to_api,
-  job_search,
   job_count,
-  format_job_df,
-  flatten_json,
-  sort,
   create_api_client_from_secrets,
 )
-from import_csv import import_to_spreadsheet
-import pandas as pd
+from pipeline import PREVIEW_ROWS, run_search_pipeline
+from process_pool import get_postprocess_pool
+from jobs import get_job_runner
+from tree_index import job_ex_categories_index
+from query import SearchQuery
+from result_cache import get_detail_cache, get_result_set_cache, get_search_checkpoint
+from metrics import SearchMetrics, json_log_listener, progress_listener
+from ai_matching import prewarm as prewarm_ai_client
+
+# 検索中のプレビュー表に出す項目（件数は pipeline.PREVIEW_ROWS）
+PREVIEW_COLUMNS = ["id", "name", "company.name", "commissionFee.fee"]
+# 検索結果数のキャッシュ保持秒数
+COUNT_CACHE_TTL_SECONDS = 300
 
 def show_search_console():
 
@@ -81,8 +90,15 @@ def show_search_console():
         # ---- 職種ごとの年数入力 ----
         job_years = {}
 
+        if selected_ex_categories:
+            # AI判定を使うセッションでは、検索前にOpenAIへの接続を温めておく
+            if not st.session_state.get("ai_client_prewarmed"):
+                st.session_state["ai_client_prewarmed"] = True
+                prewarm_ai_client()
+
+        # 同じ職種名が複数の親の下にあるため、重複を除いた葉の一覧にしてから年数を聞く
         if selected_ex_categories is not None:
-            for job in selected_ex_categories:
+            for job in job_ex_categories_index().expand(selected_ex_categories):
                 col1, col2 = st.columns([2,1])
                 with col1:
                     st.markdown(f"**{job}**")
@@ -96,30 +112,137 @@ def show_search_console():
 
 
     with right:
-          client = create_api_client_from_secrets()
-          token = login_to_api(client)
+          try:
+              query = SearchQuery.build(keyword, keyword_category, keyword_option, min_salary, max_salary, location_values, selected_categories, age, holiday_values, work_values)
+          except ValueError as e:
+              st.error(str(e))
+              return
+          client = _session_client()
+          # トークンはログインし直すと変わるので、クライアントが持っている最新のものを使う
+          token = client.token
           if token:
               try:
-                  count = job_count(client, token, keyword, keyword_category, keyword_option, min_salary, max_salary, location_values, selected_categories, age, holiday_values, work_values)
+                  count = _cached_job_count(client, token, query, query.digest)
                   st.write(f"検索結果数: {count}件")
               except Exception as e:
                   st.write("検索結果数の取得に失敗しました。")
                   # Optionally log the error: print(f"Error getting job count: {e}")
+          # 成果報酬の高い上位N件だけ詳細を取得する（0 は全件）
+          top_n = st.number_input('成果報酬の高い上位N件のみ（0で全件）', min_value=0, value=0, step=50)
+          max_results = int(top_n) or None
           # 検索ボタン
+          # 検索はバックグラウンドのジョブとして実行し、ジョブIDをセッションに保持する
           if st.button('検索'):
-            with st.spinner("求人リストを取得中..."):
               if token:
-                  job_data = job_search(client, token, keyword, keyword_category, keyword_option, min_salary, max_salary, location_values, selected_categories, age, holiday_values, work_values)
-                  if job_data:
-                        flat_data = [flatten_json(d) for d in job_data]
-                        df = pd.DataFrame(flat_data)
-                        df_sorted = sort(job_years, df)
-                        df_formatted = format_job_df(df_sorted)
-                        spreadsheet_url = import_to_spreadsheet(df_formatted)
-                        st.write(f"作成したシート：{spreadsheet_url}")
-                  elif len(job_data) < 1:
-                        st.write("検索結果が0件でした")
-                  else:
-                        st.write("求人データの取得に失敗しました。")
+                  # 同じ条件の検索が実行中なら、新しく始めずにそのジョブの進捗を表示する
+                  dedupe_key = f"{query.digest}:{max_results}:{json.dumps(job_years, ensure_ascii=False, sort_keys=True)}"
+                  st.session_state["search_job_id"] = get_job_runner().submit(
+                      _run_search_job, client, token, query, job_years, max_results, dedupe_key=dedupe_key
+                  )
               else:
-                  st.write("ログインに失敗しました。")
\ No newline at end of file
+                  st.write("ログインに失敗しました。")
+
+  job = get_job_runner().get(st.session_state.get("search_job_id"))
+  if job is not None:
+      if job.status == "running":
+          _show_job_progress(job.id)
+      else:
+          _show_job_result(job)
+
+
+def _session_client():
+  # ログインはセッションごとに1回だけ（ウィジェットを操作して再描画するたびに全アカウントでログインし直さない）
+  # トークンの期限が切れたら ApiClient が 401/403 を受けた時点でログインし直す
+  if "api_client" not in st.session_state:
+      client = create_api_client_from_secrets()
+      login_to_api(client)
+      st.session_state["api_client"] = client
+  return st.session_state["api_client"]
+
+
+def _reset_session_client():
+  # 検索に失敗したら、次の操作で新しいクライアントでログインし直す（古いクライアントはログアウトする）
+  client = st.session_state.pop("api_client", None)
+  if client is not None:
+      client.logout()
+
+
+@st.cache_data(ttl=COUNT_CACHE_TTL_SECONDS, show_spinner=False)
+def _cached_job_count(_client, _token, _query, digest):
+  # キャッシュキーは検索条件の digest だけ（選び方が違っても同じ条件なら同じキャッシュに当たる）
+  return job_count(_client, _token, _query)
+
+
+def _run_search_job(job, client, token, query, job_years, max_results=None):
+  # 進捗はプログレスバーへ、計測イベントはJSONログ(標準出力)へ流す
+  metrics = SearchMetrics([progress_listener(job.update), json_log_listener()])
+  return run_search_pipeline(
+      client, token, query, job_years,
+      metrics=metrics,
+      on_preview=job.set_preview,
+      detail_cache=get_detail_cache(),
+      result_cache=get_result_set_cache(),
+      # セッションが途中で落ちても、同じ条件で検索し直せば続きから再開する
+      checkpoint=get_search_checkpoint(query.digest, job.key),
+      max_results=max_results,
+      order_by=ORDER_BY_FEE,
+      # secrets で有効にした場合は、フラット化・整形を別プロセスで行う（他のセッションの描画を止めない）
+      pool=get_postprocess_pool(),
+  )
+
+
+@st.fragment(run_every=1.0)
+def _show_job_progress(job_id):
+  job = get_job_runner().get(job_id)
+  if job is None:
+      return
+  # ジョブが終わったら画面全体を描き直して結果を表示する
+  if job.status != "running":
+      st.rerun()
+
+  counts = job.snapshot()
+  details_total = counts.get("details_total", 0)
+  ratio = _details_done(counts) / details_total if details_total else 0.0
+  st.progress(min(ratio, 1.0), text=f"求人リストを取得中... {_progress_text(counts)}")
+  _show_preview(job.preview)
+
+
+def _show_job_result(job):
+  if job.status == "failed":
+      st.write("求人データの取得に失敗しました。")
+      # 失敗したジョブごとに1回だけ（結果を表示し直すたびにはやり直さない）
+      if st.session_state.get("client_reset_job_id") != job.id:
+          st.session_state["client_reset_job_id"] = job.id
+          print(f"search job failed: {job.error}")
+          _reset_session_client()
+  elif job.result:
+      st.write(f"作成したシート：{job.result}")
+      counts = job.snapshot()
+      if counts.get("failed_pages") or counts.get("failed_details"):
+          st.warning(f"一部の求人を取得できませんでした（一覧ページ {counts.get('failed_pages', 0)}件・求人詳細 {counts.get('failed_details', 0)}件）。取得できた求人のみ出力しています。")
+      if "new_jobs" in counts:
+          st.write(f"前回の検索から 新着: {counts['new_jobs']}件 / 掲載終了: {counts['removed_jobs']}件")
+  else:
+      st.write("検索結果が0件でした")
+  _show_preview(job.preview)
+
+
+def _show_preview(df):
+  # AIの判定結果が届くたびに上位の求人をプレビュー表示する
+  if df is None:
+      return
+  preview_columns = [c for c in PREVIEW_COLUMNS if c in df.columns]
+  st.dataframe(df[preview_columns].head(PREVIEW_ROWS), hide_index=True)
+
+
+def _details_done(counts):
+  return counts.get("details_cached", 0) + counts.get("details_from_list", 0) + counts.get("details_fetched", 0)
+
+
+def _progress_text(counts):
+  return "[{}] ページ {}/{} ・ 詳細 {}/{} (キャッシュ {} ・ 一覧から {}) ・ AI判定 {} ・ 書き込み {}".format(
+      counts.get("phase", "-"),
+      counts.get("pages_fetched", 0), counts.get("pages_total", "-"),
+      _details_done(counts), counts.get("details_total", "-"), counts.get("details_cached", 0), counts.get("details_from_list", 0),
+      counts.get("ai_scored", 0), counts.get("rows_written", 0),
+  )
@@ -0,0 +1,149 @@
+"""
+整形済みの求人dfの出力先(シンク)。
+
+どのシンクも write(df) を何回か呼んだあと close() すると出力先(URL・パス)を返す。
+チャンクに分けて書き込めるので、件数が多い場合もまとめてメモリに載せる必要がない。
+
+  SheetsSink : Google スプレッドシート（Google のライブラリは使うときに読み込む）
+  CsvSink    : CSV ファイルに追記していく
+  ParquetSink: Parquet ファイル（チャンクごとに row group として書き込む。pyarrow が必要）
+  FeatherSink: Feather(Arrow IPC) ファイル（pyarrow が必要）
+"""
+import os
+
+
+class Sink:
+    def write(self, df) -> None:
+        raise NotImplementedError
+
+    def close(self) -> str:
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SheetsSink(Sink):
+    """
+    新しいスプレッドシートを作成し、チャンクを下の行へ順に書き足していく。
+    """
+    def __init__(self, title: str | None = None):
+        self.title = title
+        self._sheet = None
+        self._url = None
+        self._next_row = 1
+        self._closed = False
+
+    def write(self, df) -> None:
+        from gspread_dataframe import set_with_dataframe
+        from import_csv import create_spreadsheet
+
+        if self._sheet is None:
+            spreadsheet, self._url = create_spreadsheet()
+            self._sheet = spreadsheet.sheet1
+            if self.title:
+                self._sheet.update_title(self.title[:100])
+        first = self._next_row == 1
+        set_with_dataframe(self._sheet, df, row=self._next_row, include_column_header=first)
+        self._next_row += len(df) + (1 if first else 0)
+
+    def close(self) -> str:
+        if self._sheet is not None and not self._closed:
+            print("✅ CSVをスプレッドシートにインポートしました！")
+        self._closed = True
+        return self._url
+
+
+class CsvSink(Sink):
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._opened = False
+
+    def _open(self):
+        self._file = open(self.path, "w", encoding="utf-8", newline="")
+        self._opened = True
+
+    def write(self, df) -> None:
+        first = not self._opened
+        if first:
+            self._open()
+        df.to_csv(self._file, index=False, header=first)
+
+    def close(self) -> str:
+        if not self._opened:
+            # 0件でも空のファイルは作っておく
+            self._open()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        return self.path
+
+
+class _ArrowSink(Sink):
+    """
+    最初のチャンクからスキーマを決め、以降のチャンクはそのスキーマにそろえて書き込む。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._writer = None
+        self._schema = None
+
+    def _open_writer(self, schema):
+        raise NotImplementedError
+
+    def _table(self, df):
+        import pyarrow as pa
+
+        if self._schema is None:
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+            # 最初のチャンクで全部空だった列は型が決まらないので文字列にしておく
+            for i, f in enumerate(schema):
+                if pa.types.is_null(f.type):
+                    schema = schema.set(i, pa.field(f.name, pa.string()))
+            self._schema = schema.remove_metadata()
+        return pa.Table.from_pandas(df, schema=self._schema, preserve_index=False, safe=False)
+
+    def write(self, df) -> None:
+        table = self._table(df)
+        if self._writer is None:
+            self._writer = self._open_writer(self._schema)
+        self._writer.write_table(table)
+
+    def close(self) -> str:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        return self.path
+
+
+class ParquetSink(_ArrowSink):
+    def _open_writer(self, schema):
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(self.path, schema)
+
+
+class FeatherSink(_ArrowSink):
+    def _open_writer(self, schema):
+        import pyarrow as pa
+        return pa.ipc.new_file(self.path, schema)
+
+
+def open_sink(target: str | None = None, title: str | None = None) -> Sink:
+    """
+    出力先の指定からシンクを作る。
+    None または "sheets" ならスプレッドシート、それ以外はファイルパスの拡張子で決める。
+    """
+    if target is None or target == "sheets":
+        return SheetsSink(title)
+    ext = os.path.splitext(target)[1].lower()
+    if ext == ".parquet":
+        return ParquetSink(target)
+    if ext in (".feather", ".arrow"):
+        return FeatherSink(target)
+    if ext == ".csv":
+        return CsvSink(target)
+    raise ValueError(f"対応していない出力先です: {target}")
@@ -0,0 +1,60 @@
+"""
+整形済みの求人行を一時ファイル(SQLite)に退避しておく入れ物。
+
+件数が多い検索で、全件をメモリに載せずに「あとから並び順どおりに少しずつ読み出す」ために使う。
+"""
+import os
+import pickle
+import sqlite3
+import tempfile
+
+import pandas as pd
+
+# SQLite の IN (...) に一度に渡すIDの数
+_READ_BATCH = 500
+
+
+class RowSpool:
+    """
+    求人ID → 整形済みの1行 を一時ファイルに保存する（先頭の列を求人IDとして扱う）。
+    同じ求人IDの行が2回来た場合は最初の行を残す。close() で一時ファイルを消す。
+    """
+    def __init__(self, directory: str | None = None):
+        fd, self.path = tempfile.mkstemp(prefix="rows_", suffix=".sqlite", dir=directory)
+        os.close(fd)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("CREATE TABLE rows (id TEXT PRIMARY KEY, row BLOB)")
+        self.columns = None
+        self.count = 0
+
+    def append(self, df: pd.DataFrame) -> None:
+        if self.columns is None:
+            self.columns = list(df.columns)
+        df = df.reindex(columns=self.columns)
+        rows = ((str(row[0]), pickle.dumps(row)) for row in df.itertuples(index=False, name=None))
+        cur = self._conn.executemany("INSERT OR IGNORE INTO rows VALUES (?, ?)", rows)
+        self.count += cur.rowcount
+        self._conn.commit()
+
+    def read(self, ids) -> pd.DataFrame:
+        """ids の順に並べた行を返す（保存されていないIDは飛ばす）。"""
+        keys = [str(i) for i in ids]
+        found = {}
+        for start in range(0, len(keys), _READ_BATCH):
+            batch = keys[start:start + _READ_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            for key, blob in self._conn.execute(f"SELECT id, row FROM rows WHERE id IN ({placeholders})", batch):
+                found[key] = pickle.loads(blob)
+        return pd.DataFrame([found[k] for k in keys if k in found], columns=self.columns)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,114 @@
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Tuple
+
+from definitions import job_categories_tree, job_ex_categories_tree, parent_occupation_codes
+
+
+class TreeIndex:
+    """
+    st_ant_tree 用のツリー定義(value/title/children)から作る索引。
+    ツリーを毎回たどらずに、コード→ラベル・ラベル→コード・親→葉 を引けるようにする。
+
+    label_by_code: value → title（親ノードも含む）
+    codes_by_label: title → value のタプル（同じラベルが複数の親の下にある場合があるため）
+    leaves_by_parent: 親の value → 配下の葉の value のタプル（ツリー順）
+    parent_by_leaf: 葉の value → 最初に見つかった親の value
+    """
+    def __init__(self, tree: List[Dict[str, Any]]):
+        self.tree = tree
+        self.label_by_code: Dict[Any, str] = {}
+        self.codes_by_label: Dict[str, Tuple[Any, ...]] = {}
+        self.leaves_by_parent: Dict[Any, Tuple[Any, ...]] = {}
+        self.parent_by_leaf: Dict[Any, Any] = {}
+        # 葉のツリー上の並び順（正規化したときの並びに使う）
+        self.leaf_order: Dict[Any, int] = {}
+        for node in tree:
+            self._add(node, None)
+
+    def _add(self, node, parent) -> Tuple[Any, ...]:
+        value, title = node["value"], node["title"]
+        self.label_by_code.setdefault(value, title)
+        codes = self.codes_by_label.get(title, ())
+        if value not in codes:
+            self.codes_by_label[title] = codes + (value,)
+
+        children = node.get("children")
+        if not children:
+            self.leaf_order.setdefault(value, len(self.leaf_order))
+            if parent is not None:
+                self.parent_by_leaf.setdefault(value, parent)
+            return (value,)
+
+        leaves = []
+        for child in children:
+            leaves.extend(self._add(child, value))
+        self.leaves_by_parent[value] = tuple(dict.fromkeys(leaves))
+        return self.leaves_by_parent[value]
+
+    def is_leaf(self, code) -> bool:
+        return code in self.leaf_order
+
+    def expand(self, codes: Iterable[Any] | None) -> List[Any]:
+        """
+        選択値（親・葉が混在してよい）を葉のコードに展開し、重複を除いてツリー順に並べる。
+        ツリーにないコードは末尾にそのまま残す。
+        """
+        if not codes:
+            return []
+        leaves = {}
+        unknown = {}
+        for code in codes:
+            if code in self.leaves_by_parent:
+                for leaf in self.leaves_by_parent[code]:
+                    leaves[leaf] = None
+            elif code in self.leaf_order:
+                leaves[code] = None
+            else:
+                unknown[code] = None
+        ordered = sorted(leaves, key=self.leaf_order.__getitem__)
+        return ordered + list(unknown)
+
+    def collapse(self, codes: Iterable[Any] | None, parent_codes: Dict[Any, Any] | None = None) -> Tuple[Any, ...]:
+        """
+        選択値を正規化した形（重複・包含を除いたツリー順のタプル）にする。
+        parent_codes に登録された親は、配下の葉がすべて選ばれていれば親のコード1つにまとめる。
+        """
+        leaves = self.expand(codes)
+        if not parent_codes:
+            return tuple(leaves)
+        selected = set(leaves)
+        covered = set()
+        collapsed = []
+        for leaf in leaves:
+            if leaf in covered:
+                continue
+            parent = self.parent_by_leaf.get(leaf)
+            if parent in parent_codes and all(l in selected for l in self.leaves_by_parent[parent]):
+                collapsed.append(parent_codes[parent])
+                covered.update(self.leaves_by_parent[parent])
+            else:
+                collapsed.append(leaf)
+        return tuple(collapsed)
+
+    def labels(self, codes: Iterable[Any] | None) -> List[str]:
+        return [self.label_by_code.get(code, str(code)) for code in codes or []]
+
+
+@lru_cache(maxsize=None)
+def job_categories_index() -> TreeIndex:
+    """希望職種ツリー(job_categories_tree)の索引。初回呼び出し時に一度だけ作る。"""
+    return TreeIndex(job_categories_tree)
+
+
+@lru_cache(maxsize=None)
+def job_ex_categories_index() -> TreeIndex:
+    """経験職種ツリー(job_ex_categories_tree)の索引。初回呼び出し時に一度だけ作る。"""
+    return TreeIndex(job_ex_categories_tree)
+
+
+def normalize_occupations(categories: Iterable[Any] | None) -> Tuple[Any, ...]:
+    """
+    希望職種の選択値を、APIの occupations パラメータに送る正規形にする。
+    結果はハッシュ可能なタプルなので、件数・検索結果のキャッシュキーにもそのまま使える。
+    """
+    return job_categories_index().collapse(categories, parent_occupation_codes)